@@ -1,3 +1,36 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import CachedAnswer, Chunk, ConversationMemory, ConversationTurn, Corpus, CorpusDocument, Document, Summary
+
+
+@admin.register(Document)
+class DocumentAdmin(admin.ModelAdmin):
+    list_display = ("name", "kind", "session_key", "created_at")
+    list_filter = ("kind",)
+
+
+class CorpusDocumentInline(admin.TabularInline):
+    model = CorpusDocument
+    extra = 0
+
+
+@admin.register(Corpus)
+class CorpusAdmin(admin.ModelAdmin):
+    list_display = ("key", "created_at")
+    inlines = [CorpusDocumentInline]
+
+
+@admin.register(ConversationTurn)
+class ConversationTurnAdmin(admin.ModelAdmin):
+    list_display = ("question", "session_key", "created_at")
+
+
+@admin.register(CachedAnswer)
+class CachedAnswerAdmin(admin.ModelAdmin):
+    list_display = ("question", "hits", "created_at", "used_at")
+
+
+admin.site.register(Chunk)
+admin.site.register(Summary)
+admin.site.register(ConversationMemory)
+
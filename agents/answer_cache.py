@@ -0,0 +1,207 @@
+import difflib
+import hashlib
+import threading
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import CachedAnswer
+from .retrieval import STOPWORDS, TOKEN_RE
+from .store import get_target_files, get_url_documents
+from .tracing import inc
+
+
+DEFAULTS = {
+    "ENABLED": True,
+    "TTL": 24 * 3600,
+    "SIMILARITY": 0.8,  # minimum character similarity for a near-duplicate with the same key terms
+    "MAX_ENTRIES": 5000,
+}
+QUESTION_WORDS = frozenset("what when where which who why how".split())
+# A question only counts as self-contained when it opens like a full question or request...
+SELF_CONTAINED_OPENERS = QUESTION_WORDS | frozenset(
+    "is are was were do does did can could should will would has have "
+    "define explain describe list summarize compare".split()
+)
+# ...and has none of the words that point back at earlier turns
+FOLLOW_UP_WORDS = frozenset(
+    "it its it's this that these those they them their he him his she her above earlier previous "
+    "previously before again also else more same former latter one ones other others first second last "
+    "then so".split()
+)
+FOLLOW_UP_OPENERS = ("and ", "but ", "so ", "what about", "how about", "why not", "then ")
+
+_lock = threading.Lock()
+_stats = {"exact": 0, "near": 0, "miss": 0}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "ANSWER_CACHE", {})}
+
+
+def _sha(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ---------------------- KEYS ----------------------
+def normalize(question):
+    text = unicodedata.normalize("NFKC", question).lower()
+    return " ".join(TOKEN_RE.findall(text))
+
+
+def key_terms(normalized):
+    """Content words, plus question words, with a plural "s" dropped; order and filler words don't matter."""
+    terms = set()
+    for word in normalized.split():
+        if len(word) < 2 or (word in STOPWORDS and word not in QUESTION_WORDS):
+            continue
+        terms.add(word[:-1] if len(word) > 3 and word.endswith("s") else word)
+    return " ".join(sorted(terms))
+
+
+def self_contained(question):
+    """Whether ``question`` is known to read the same without the conversation so far.
+
+    Only then is memory left out of its cache key. Anything short or open-ended
+    ("Why?", "Give an example", "Continue") is treated as a follow-up.
+    """
+    normalized = normalize(question)
+    words = normalized.split()
+    if len(words) < 3 or words[0] not in SELF_CONTAINED_OPENERS or normalized.startswith(FOLLOW_UP_OPENERS):
+        return False
+    if any(word in FOLLOW_UP_WORDS for word in words):
+        return False
+    # It has to name what it asks about
+    return any(len(word) > 1 and word not in STOPWORDS and word not in SELF_CONTAINED_OPENERS for word in words)
+
+
+def corpus_fingerprint(request, file_path="", document_ids=None):
+    """Hash of what the answer can depend on: each active document's content and summaries.
+
+    Returns None while an uploaded file has no document yet, since answers are
+    then built from a temporary index and should not be cached.
+    """
+    files = get_target_files(request, document_ids)
+    if file_path and not any(document.path == file_path for document in files):
+        return None
+    documents = list(get_url_documents(request).values()) + files
+    if not documents:
+        # Answered from the model alone, so there is no shared corpus to key on; stay within the session
+        session_key = request.session.session_key
+        return _sha(f"session:{session_key}") if session_key else None
+
+    parts = []
+    for document in sorted(documents, key=lambda d: (d.kind, d.name)):
+        parts.append(f"{document.kind}:{document.name}:{document.index_key}:{document.summaries_digest}")
+    return _sha("\n".join(parts))
+
+
+def context_key(request, file_path="", memory="", document_ids=None, question=None, namespace="chat"):
+    """Cache key for answers to ``question`` against the session's corpus, model and rules.
+
+    ``memory`` is part of the key unless the question is self-contained, so a
+    full question repeated later in a chat still hits while follow-ups never
+    share an answer across conversations. ``namespace`` keeps answers built
+    differently (batch answers ignore the chat) from being served to each other.
+    """
+    fingerprint = corpus_fingerprint(request, file_path, document_ids)
+    if fingerprint is None:
+        return None
+    session = request.session
+    rules = "\n".join(session.get("rules", []))
+    if question is not None and self_contained(question):
+        memory = ""
+    return _sha("\x1f".join([namespace, fingerprint, session.get("model_name") or "", rules, memory or ""]))
+
+
+# ---------------------- LOOKUP ----------------------
+def _count(result):
+    inc("answer_cache_lookups_total", result=result)
+    with _lock:
+        _stats[result] += 1
+
+
+def lookup(key, question):
+    """The cached result for ``question`` under ``key``, matching exactly or as a near-duplicate."""
+    config = get_config()
+    if not config["ENABLED"] or key is None:
+        return None
+
+    normalized = normalize(question)
+    entries = CachedAnswer.objects.filter(
+        context_key=key, created_at__gt=timezone.now() - timedelta(seconds=config["TTL"]),
+    )
+    entry = entries.filter(question_key=_sha(normalized)).first()
+    result = "exact"
+    if entry is None:
+        # Same key terms, and close enough as text that a changed word order or article is all that differs
+        result = "near"
+        for candidate in entries.filter(terms_key=_sha(key_terms(normalized))).order_by("-used_at")[:20]:
+            if difflib.SequenceMatcher(None, normalized, candidate.question).ratio() >= config["SIMILARITY"]:
+                entry = candidate
+                break
+
+    if entry is None:
+        _count("miss")
+        return None
+
+    _count(result)
+    CachedAnswer.objects.filter(pk=entry.pk).update(hits=F("hits") + 1, used_at=timezone.now())
+    print(f"💾 Answer cache {result} hit")
+    return {
+        "retrieved_data": entry.retrieved_data,
+        "summarized_data": entry.summarized_data,
+        "final_answer": entry.final_answer,
+        "cache": result,
+    }
+
+
+def store(key, question, result):
+    config = get_config()
+    if not config["ENABLED"] or key is None or not result.get("final_answer"):
+        return
+    normalized = normalize(question)
+    CachedAnswer.objects.create(
+        context_key=key,
+        question_key=_sha(normalized),
+        terms_key=_sha(key_terms(normalized)),
+        question=normalized,
+        retrieved_data=result.get("retrieved_data") or "",
+        summarized_data=result.get("summarized_data") or "",
+        final_answer=result["final_answer"],
+    )
+    evict()
+
+
+# ---------------------- MAINTENANCE ----------------------
+def evict():
+    config = get_config()
+    CachedAnswer.objects.filter(created_at__lte=timezone.now() - timedelta(seconds=config["TTL"])).delete()
+    # Least recently used beyond the cap
+    stale = list(CachedAnswer.objects.order_by("-used_at").values_list("pk", flat=True)[config["MAX_ENTRIES"]:])
+    if stale:
+        CachedAnswer.objects.filter(pk__in=stale).delete()
+
+
+def clear():
+    # Entries for a changed corpus are never matched again; this also drops the ones still valid
+    CachedAnswer.objects.all().delete()
+    with _lock:
+        for result in _stats:
+            _stats[result] = 0
+
+
+def stats():
+    with _lock:
+        counts = dict(_stats)
+    lookups = sum(counts.values())
+    totals = CachedAnswer.objects.aggregate(entries=Count("id"), hits=Sum("hits"))
+    return {
+        **counts,
+        "hit_rate": (counts["exact"] + counts["near"]) / lookups if lookups else 0.0,
+        "entries": totals["entries"],
+        "stored_hits": totals["hits"] or 0,
+    }
@@ -0,0 +1,142 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from langchain_core.messages import HumanMessage
+
+from . import answer_cache
+from .chunking import count_tokens
+from .context_packer import pack_context
+from .retrieval import BM25Index, get_top_k
+from .scheduler import BACKGROUND, priority
+from .store import get_summaries, get_target_files, get_url_documents
+from .summarizer import get_concurrency
+from .summary_tree import SEPARATOR, summary_context
+from .tracing import inc, span
+from .utils import answer_prompt, get_llm, load_document_index
+
+
+DEFAULTS = {
+    "MAX_QUESTIONS": 500,
+    "WORKERS": None,  # concurrent QA calls; defaults to the provider's LLM_CONCURRENCY
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "BATCH_QUESTIONS", {})}
+
+
+class BatchCorpus:
+    """A session's documents with their indexes, loaded once and shared by every question of a batch.
+
+    Summary-tree lookups are memoized too, so questions that hit the same
+    chunks reuse the same context.
+    """
+
+    def __init__(self, request, document_ids=None):
+        self.files = []
+        for document in get_target_files(request, document_ids):
+            index = load_document_index(document)
+            if index is not None and index.chunks:
+                self.files.append((document, index))
+        self.urls = []
+        for url, document in get_url_documents(request).items():
+            index = load_document_index(document)
+            if index is not None and index.chunks:
+                self.urls.append((url, document, index))
+        self._contexts = {}
+
+    def _context(self, document, index, hits, budget):
+        key = (document.pk, tuple(hits), budget)
+        if key in self._contexts:
+            return self._contexts[key]
+        # Finished documents have a summary tree; fall back to chunk summaries, then raw chunks
+        context = (
+            summary_context(document, hits, budget)
+            or SEPARATOR.join(get_summaries(document, hits))
+            or SEPARATOR.join(index.chunks[h] for h in hits)
+        )
+        self._contexts[key] = context
+        return context
+
+    def sources(self, question, budget):
+        """``(kind, name, text)`` sources for ``question``, half the budget for files and half for URLs."""
+        sources = []
+        if self.files:
+            share = budget // 2 // len(self.files)
+            found = BM25Index.search_many([index for _, index in self.files], question, get_top_k())
+            for i, hits in sorted(found.items()):
+                document, index = self.files[i]
+                sources.append(("file", document.name, self._context(document, index, hits, share)))
+        if self.urls:
+            share = budget // 2 // len(self.urls)
+            for url, document, index in self.urls:
+                hits = index.search(question, get_top_k())
+                sources.append(("url", url, self._context(document, index, hits, share)))
+        return sources
+
+
+def _ask(llm, prompt):
+    # Bulk questions yield the provider's rate budget to people using the app
+    with priority(BACKGROUND):
+        return llm.invoke([HumanMessage(content=prompt)]).content
+
+
+def answer_batch(request, questions, document_ids=None):
+    """Answer ``questions`` against the session's corpus, yielding one result dict per question as it finishes.
+
+    The corpus, its indexes and the answer-cache key are loaded once; each
+    question then only costs a BM25 lookup, a context pack and its QA call,
+    and the QA calls run concurrently. Questions are answered independently
+    of the chat history. A last ``{"done": true, ...}`` dict summarizes the batch.
+    """
+    started = time.perf_counter()
+    llm = get_llm(request)
+    config = get_config()
+    with span("batch_load"):
+        corpus = BatchCorpus(request, document_ids)
+        key = answer_cache.context_key(request, document_ids=document_ids, namespace="batch")
+    budget = llm.budget["chunk_tokens"]
+    workers = config["WORKERS"] or get_concurrency(request.session.get("model_name"))
+    print(f"📦 Batch of {len(questions)} question(s) over {len(corpus.files)} file(s) and "
+          f"{len(corpus.urls)} URL(s), {workers} workers")
+
+    answered = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for i, question in enumerate(questions):
+            cached = answer_cache.lookup(key, question)
+            if cached is not None:
+                answered += 1
+                inc("batch_questions_total", result="cached")
+                yield {"index": i, "question": question, "answer": cached["final_answer"], "cache": cached["cache"]}
+                continue
+
+            context, report = pack_context(question, corpus.sources(question, budget), budget - count_tokens(question))
+            future = pool.submit(_ask, llm, answer_prompt(question, context))
+            futures[future] = (i, question, context, report, time.perf_counter())
+
+        for future in as_completed(futures):
+            i, question, context, report, submitted = futures[future]
+            try:
+                answer = future.result()
+            except Exception as e:
+                inc("batch_questions_total", result="error")
+                yield {"index": i, "question": question, "error": str(e)}
+                continue
+            answered += 1
+            inc("batch_questions_total", result="answered")
+            answer_cache.store(key, question, {"retrieved_data": context, "final_answer": answer})
+            yield {
+                "index": i,
+                "question": question,
+                "answer": answer,
+                "cache": None,
+                "seconds": round(time.perf_counter() - submitted, 3),
+                "sources": sorted({passage["source"] for passage in report["included"]}),
+                "context_tokens": report["tokens"],
+            }
+
+    seconds = time.perf_counter() - started
+    print(f"✅ Batch answered {answered}/{len(questions)} in {seconds:.1f}s")
+    yield {"done": True, "questions": len(questions), "answered": answered, "seconds": round(seconds, 3)}
@@ -0,0 +1,381 @@
+"""Offline benchmarks: a local stub LLM/web server plus scenarios that drive the real views."""
+import json
+import os
+import random
+import resource
+import shutil
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from .chunking import count_tokens
+
+
+WORDS = (
+    "system data model query answer document summary context token latency cache index chunk "
+    "retrieval language network request page section report result budget memory stream graph"
+).split()
+
+
+# ---------------------- STUB SERVER ----------------------
+class StubStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.recent = []  # request times within the last minute
+        self.rejected = 0
+
+    def admit(self, rpm):
+        """0 if a request fits the per-minute limit, otherwise the seconds until it would."""
+        if not rpm:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.recent = [t for t in self.recent if t > now - 60]
+            if len(self.recent) >= rpm:
+                self.rejected += 1
+                return self.recent[0] + 60 - now
+            self.recent.append(now)
+            return 0
+
+    def record(self, api, prompt_tokens, completion_tokens):
+        with self.lock:
+            stats = self.counts.setdefault(api, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+
+    def snapshot(self):
+        with self.lock:
+            return {api: dict(stats) for api, stats in self.counts.items()}, self.rejected
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Fixture pages for the URL ingestion scenarios, with validators for conditional GETs;
+        # ?delay=<seconds> stands in for a slow site
+        path, _, query = self.path.partition("?")
+        page = self.server.pages.get(path)
+        delay = parse_qs(query).get("delay")
+        if delay:
+            time.sleep(float(delay[0]))
+        if page is None:
+            self._send(404, b"{}")
+            return
+        etag = f'"{hash(page) & 0xffffffff:x}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", headers={"ETag": etag})
+            return
+        self._send(200, page.encode("utf-8"), "text/html; charset=utf-8", {"ETag": etag})
+
+    def do_POST(self):
+        # /openai/v1/chat/completions for ChatOpenAI, /mistral/v1/chat/completions for MistralWrapper
+        api = self.path.strip("/").split("/", 1)[0]
+        if not self.path.endswith("/chat/completions"):
+            self._send(404, b"{}")
+            return
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        config = self.server.config
+        retry_after = self.server.stats.admit(config["rpm"])
+        if retry_after:
+            # Provider-style rate limit: requests over the per-minute budget get a 429
+            self._send(429, b'{"error": "rate limited"}', headers={"Retry-After": f"{retry_after:.2f}"})
+            return
+        prompt_tokens = sum(count_tokens(message.get("content") or "") for message in payload.get("messages", []))
+        words = [WORDS[(prompt_tokens + i) % len(WORDS)] for i in range(config["completion_tokens"])]
+        self.server.stats.record(api, prompt_tokens, len(words))
+
+        time.sleep(config["latency"])
+        delay = 1 / config["tokens_per_second"] if config["tokens_per_second"] else 0
+        model = payload.get("model", "stub")
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                 "total_tokens": prompt_tokens + len(words)}
+
+        if not payload.get("stream"):
+            time.sleep(delay * len(words))
+            body = {
+                "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            }
+            self._send(200, json.dumps(body).encode("utf-8"))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, word in enumerate(words):
+            time.sleep(delay)
+            chunk = {
+                "id": "stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                             "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+@contextmanager
+def stub_server(latency=0.05, tokens_per_second=200, completion_tokens=64, pages=None, rpm=0):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.config = {"latency": latency, "tokens_per_second": tokens_per_second,
+                     "completion_tokens": completion_tokens, "rpm": rpm}
+    server.stats = StubStats()
+    server.pages = pages or {}
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# ---------------------- FIXTURES ----------------------
+def _paragraphs(count, seed):
+    rng = random.Random(seed)
+    for _ in range(count):
+        sentences = (
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+            for _ in range(rng.randint(3, 6))
+        )
+        yield " ".join(sentences)
+
+
+def make_fixtures(directory, pages=20):
+    """Write a PDF, DOCX and PPTX of about ``pages`` pages each; returns their paths."""
+    import docx
+    import fitz
+    import pptx
+
+    paths = {}
+    per_page = 6
+
+    path = os.path.join(directory, "bench.pdf")
+    pdf = fitz.open()
+    for page_number in range(pages):
+        page = pdf.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), "\n\n".join(_paragraphs(per_page, page_number)), fontsize=9)
+    pdf.save(path)
+    pdf.close()
+    paths["pdf"] = path
+
+    path = os.path.join(directory, "bench.docx")
+    document = docx.Document()
+    for page_number in range(pages):
+        document.add_heading(f"Section {page_number + 1}", level=1)
+        for paragraph in _paragraphs(per_page, page_number):
+            document.add_paragraph(paragraph)
+    document.save(path)
+    paths["docx"] = path
+
+    path = os.path.join(directory, "bench.pptx")
+    presentation = pptx.Presentation()
+    for page_number in range(pages):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {page_number + 1}"
+        slide.placeholders[1].text = "\n".join(_paragraphs(per_page // 2, page_number))
+    presentation.save(path)
+    paths["pptx"] = path
+    return paths
+
+
+def make_pages(pages=20):
+    """HTML fixture pages keyed by path, with the navigation and script noise of a real site."""
+    body = "".join(f"<h2>Section {i + 1}</h2>" + "".join(f"<p>{p}</p>" for p in _paragraphs(6, i))
+                   for i in range(pages))
+    page = (
+        "<html><head><title>Bench</title><style>p { margin: 0 }</style>"
+        "<script>var tracking = 1;</script></head><body>"
+        "<nav><a href='/'>Home</a> <a href='/about'>About</a></nav>"
+        f"<div id='bodyContent'>{body}</div><footer>Footer</footer></body></html>"
+    )
+    large = page.replace(body, body * 50)  # far past the byte and character caps of the URL fetcher
+    return {
+        "/pages/bench.html": page,
+        "/pages/small.html": page[:len(page) // 10] + "</div></body></html>",
+        "/pages/large.html": large,
+    }
+
+
+# ---------------------- SCENARIOS ----------------------
+def _last_job_id():
+    from .models import IngestionJob
+
+    return IngestionJob.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+
+
+def _wait_for_jobs(timeout, after_id):
+    """Wait for the jobs created after job ``after_id``, i.e. by the current scenario, and fail if any did."""
+    from .models import IngestionJob
+
+    jobs = IngestionJob.objects.filter(pk__gt=after_id)
+    deadline = time.monotonic() + timeout
+    while jobs.filter(status__in=[IngestionJob.PENDING, IngestionJob.RUNNING]).exists():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Ingestion did not finish within {timeout}s.")
+        time.sleep(0.05)
+    failed = jobs.filter(status=IngestionJob.FAILED).values_list("error", flat=True)
+    if failed:
+        raise RuntimeError(f"Ingestion failed: {failed[0]}")
+
+
+@contextmanager
+def measure(server, results, name):
+    before, rejected_before = server.stats.snapshot()
+    tracemalloc.start()
+    started = time.perf_counter()
+    error = ""
+    try:
+        yield
+    except Exception as e:
+        error = str(e)
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    after, rejected = server.stats.snapshot()
+    totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    for api, stats in after.items():
+        for field in totals:
+            totals[field] += stats[field] - before.get(api, {}).get(field, 0)
+    results.append({
+        "scenario": name,
+        "wall_seconds": round(wall, 3),
+        "llm_calls": totals["calls"],
+        "prompt_tokens": totals["prompt_tokens"],
+        "completion_tokens": totals["completion_tokens"],
+        "rate_limited": rejected - rejected_before,
+        "peak_python_mb": round(peak / 1024 / 1024, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "error": error,
+    })
+
+
+def run_parse_scenarios(server):
+    """Fetch and parse each fixture page, then parse it again from memory, to separate network from parse cost."""
+    from .webpage import extract_main_text, fetch_page
+
+    results = []
+    for page, html in server.pages.items():
+        name = page.rsplit("/", 1)[-1]
+        with measure(server, results, f"fetch_page ({name}, {len(html) // 1024} KB)"):
+            fetch_page(server.url + page)
+        with measure(server, results, f"extract_main_text ({name})"):
+            extract_main_text(html)
+    return results
+
+
+def run_fetch_scenarios(server, urls=10, delay=0.5):
+    """Fetch ``urls`` slow pages one by one and as a batch, then a batch where one page outlives the deadline."""
+    from .fetcher import fetch_many
+    from .utils import fetch_url_if_modified
+
+    results = []
+    page = server.url + "/pages/small.html"
+    batch = [(f"{page}?delay={delay}&n={i}", ()) for i in range(urls)]
+
+    with measure(server, results, f"fetch one by one ({urls} urls, {delay}s each)"):
+        for url, _ in batch:
+            fetch_url_if_modified(url)
+    with measure(server, results, f"fetch_many ({urls} urls, {delay}s each)"):
+        _check_batch(fetch_many(fetch_url_if_modified, batch), urls)
+
+    slow = [(f"{page}?delay={delay * 10}", ())]
+    fetched = []
+    with measure(server, results, f"fetch_many (+1 url slower than a {delay * 4}s deadline)"):
+        fetched = fetch_many(fetch_url_if_modified, batch + slow, deadline=delay * 4)
+        _check_batch(fetched, urls)
+        if not isinstance(fetched[-1][1], TimeoutError):
+            raise RuntimeError("The slow URL was not cut off by the deadline.")
+    results[-1]["scenario"] += f": {sum(1 for _, error in fetched if error is None)}/{len(fetched)} fetched"
+    return results
+
+
+def _check_batch(fetched, expected):
+    # Fails the scenario unless the first ``expected`` URLs were all fetched
+    errors = [error for _, error in fetched[:expected] if error is not None]
+    if errors:
+        raise RuntimeError(f"{len(errors)}/{expected} URL(s) failed: {errors[0]!r}")
+
+
+def _ask(client, url, question):
+    # The view reports failures as messages on a 200 page; any of them fails the scenario
+    response = client.post(url, {"input_text": question})
+    if response.status_code != 200:
+        raise RuntimeError(f"index returned {response.status_code}")
+    errors = [str(m) for m in response.context["messages"] if m.level_tag == "error"]
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    if not (response.context["result"] or {}).get("final_answer"):
+        raise RuntimeError("index returned no result")
+    return response
+
+
+def run_scenarios(server, model, fixtures, timeout=600, question="What does the document say about latency?"):
+    """Drive upload_file_only, add_link and a question through the views with a test client."""
+    from django.core.files.storage import default_storage
+    from django.test import Client
+    from django.urls import reverse
+
+    from .models import Corpus, Document, IngestionJob
+
+    results = []
+    client = Client()
+    with measure(server, results, f"{model}: set_model"):
+        client.post(reverse("set_model"), {"model_name": model, "api_key": "bench-key"})
+        if client.session.get("model_name") != model:
+            raise RuntimeError(f"set_model did not select {model}")
+    if results[-1]["error"]:
+        return results  # every later scenario would run without a model
+
+    for kind, path in fixtures.items():
+        baseline = _last_job_id()
+        with measure(server, results, f"{model}: upload_file_only ({kind})"):
+            with open(path, "rb") as f:
+                client.post(reverse("upload_file_only"), {"uploaded_file": f})
+            _wait_for_jobs(timeout, baseline)
+        client.get(reverse("index"))  # attaches the finished document to the session
+
+        with measure(server, results, f"{model}: process_file_with_graph ({kind})"):
+            _ask(client, reverse("index"), question)
+
+    for page in server.pages:
+        baseline = _last_job_id()
+        with measure(server, results, f"{model}: add_link ({page.rsplit('/', 1)[-1]})"):
+            client.post(reverse("add_link"), {"url": server.url + page})
+            _wait_for_jobs(timeout, baseline)
+        client.get(reverse("index"))
+
+    with measure(server, results, f"{model}: process_file_with_graph (file + urls)"):
+        _ask(client, reverse("index"), question)
+
+    # Start the next model from scratch rather than from shared, already-processed files
+    IngestionJob.objects.all().delete()
+    Corpus.objects.all().delete()
+    Document.objects.all().delete()
+    shutil.rmtree(os.path.join(default_storage.location, "uploads"), ignore_errors=True)
+    return results
@@ -0,0 +1,153 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+
+DEFAULT_BUDGET = {"context_tokens": 8192, "chunk_tokens": 6000}
+DEFAULT_OVERLAP_TOKENS = 200
+CHARS_PER_TOKEN = 4
+
+PARAGRAPH_RE = re.compile(r".*?(?:\n[ \t]*\n\s*|\Z)", re.S)
+SENTENCE_RE = re.compile(r"[^.!?؟。\n]*(?:[.!?؟。]+[\"')\]]*\s*|\n\s*|$)")
+HEADING_RE = re.compile(r"^(?:#{1,6}\s+\S|\d+(?:\.\d+)*\.?\s+[A-Z]\S*|[A-Z][A-Z0-9 ,:&/-]{2,78}$)")
+
+
+# ---------------------- TOKEN BUDGETS ----------------------
+def get_model_budget(model):
+    budgets = getattr(settings, "LLM_MODELS", {})
+    return {**DEFAULT_BUDGET, **budgets.get(model, {})}
+
+
+def get_overlap_tokens():
+    return getattr(settings, "CHUNK_OVERLAP_TOKENS", DEFAULT_OVERLAP_TOKENS)
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+# ---------------------- SPLITTING ----------------------
+def _hard_split(text, tokens, max_tokens):
+    # A single sentence longer than the budget; cut it into roughly equal slices
+    pieces = -(-tokens // max_tokens)
+    size = -(-len(text) // pieces)
+    for i in range(0, len(text), size):
+        piece = text[i:i + size]
+        yield piece, count_tokens(piece), False
+
+
+def _split_paragraph(paragraph, max_tokens):
+    tokens = count_tokens(paragraph)
+    if tokens <= max_tokens:
+        heading = bool(HEADING_RE.match(paragraph.strip().split("\n", 1)[0]))
+        yield paragraph, tokens, heading
+        return
+
+    for match in SENTENCE_RE.finditer(paragraph):
+        sentence = match.group(0)
+        if not sentence:
+            continue
+        sentence_tokens = count_tokens(sentence)
+        if sentence_tokens <= max_tokens:
+            yield sentence, sentence_tokens, False
+        else:
+            yield from _hard_split(sentence, sentence_tokens, max_tokens)
+
+
+def _iter_units(sections, max_tokens):
+    """Yield ``(text, tokens, is_heading)`` units that each fit the budget, keeping their separators."""
+    max_pending = max_tokens * CHARS_PER_TOKEN * 2
+    pending = []
+    pending_size = 0
+
+    def split(text):
+        for match in PARAGRAPH_RE.finditer(text):
+            if match.group(0):
+                yield from _split_paragraph(match.group(0), max_tokens)
+
+    for section in sections:
+        pending.append(section)
+        pending_size += len(section)
+        if pending_size < max_pending:
+            continue
+
+        # Only hand off text up to the last paragraph (or line) break; the tail may continue in the next section
+        text = "".join(pending)
+        cut = text.rfind("\n\n")
+        if cut != -1:
+            cut += 2
+        else:
+            cut = text.rfind("\n") + 1 or len(text)
+        yield from split(text[:cut])
+        pending = [text[cut:]]
+        pending_size = len(pending[0])
+
+    text = "".join(pending)
+    if text.strip():
+        yield from split(text)
+
+
+# ---------------------- PACKING ----------------------
+def _overlap(chunk, overlap_tokens):
+    """Trailing units of ``chunk`` (down to single sentences) that fit in ``overlap_tokens``."""
+    carried = []
+    budget = overlap_tokens
+    for unit, unit_tokens in reversed(chunk):
+        if unit_tokens <= budget:
+            carried.insert(0, (unit, unit_tokens))
+            budget -= unit_tokens
+            continue
+        for match in reversed([m for m in SENTENCE_RE.finditer(unit) if m.group(0)]):
+            sentence_tokens = count_tokens(match.group(0))
+            if sentence_tokens > budget:
+                break
+            carried.insert(0, (match.group(0), sentence_tokens))
+            budget -= sentence_tokens
+        break
+    return carried
+
+
+def chunk_text(sections, max_tokens, overlap_tokens=0):
+    """Pack paragraphs/sentences greedily into chunks of at most ``max_tokens``.
+
+    Chunks break on headings once they are half full, and each new chunk
+    repeats up to ``overlap_tokens`` of trailing units from the previous one.
+    """
+    if isinstance(sections, str):
+        sections = [sections]
+    overlap_tokens = min(overlap_tokens, max_tokens // 4)
+
+    chunk = []
+    size = 0
+    for text, tokens, heading in _iter_units(sections, max_tokens):
+        if chunk and (size + tokens > max_tokens or (heading and size > max_tokens // 2)):
+            packed = "".join(unit for unit, _ in chunk).strip()
+            if packed:
+                yield packed
+
+            carried = [] if heading else _overlap(chunk, overlap_tokens)
+            carried_size = sum(unit_tokens for _, unit_tokens in carried)
+            if carried_size + tokens > max_tokens:
+                carried, carried_size = [], 0
+            chunk, size = carried, carried_size
+
+        chunk.append((text, tokens))
+        size += tokens
+
+    if chunk:
+        last = "".join(unit for unit, _ in chunk).strip()
+        if last:
+            yield last
@@ -0,0 +1,121 @@
+import re
+import time
+
+from django.conf import settings
+
+from .chunking import chunk_text, count_tokens
+from .retrieval import BM25Index, tokenize
+from .tracing import inc, record
+
+
+DEFAULTS = {
+    "MAX_PASSAGE_TOKENS": 800,  # longer passages are split so one big summary cannot take the whole budget
+    "DUPLICATE_SIMILARITY": 0.8,  # word-shingle overlap above which a passage repeats one already packed
+}
+PASSAGE_SPLIT_RE = re.compile(r"\n-{3,}\n|\n\s*\n")
+SOURCE_HEADER_RE = re.compile(r"^\[From (file|URL): (.+?)\]\n", re.M)
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "CONTEXT_PACKING", {})}
+
+
+def split_sources(kind, text):
+    """``(kind, name, text)`` for each "[From file: ...]" / "[From URL: ...]" section of ``text``."""
+    parts = SOURCE_HEADER_RE.split(text)
+    sources = [(kind, "", parts[0])] if parts[0].strip() else []
+    for i in range(1, len(parts), 3):
+        sources.append(("url" if parts[i] == "URL" else "file", parts[i + 1], parts[i + 2]))
+    return sources
+
+
+def _passages(text, max_tokens):
+    for passage in PASSAGE_SPLIT_RE.split(text):
+        passage = passage.strip()
+        if not passage:
+            continue
+        if count_tokens(passage) <= max_tokens:
+            yield passage
+        else:
+            yield from chunk_text([passage], max_tokens, 0)
+
+
+def _shingles(text):
+    words = tokenize(text)
+    return {tuple(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+
+
+def _similarity(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def pack_context(question, sources, budget):
+    """Pick the passages of ``sources`` that best answer ``question`` within ``budget`` tokens.
+
+    ``sources`` is a list of ``(kind, name, text)``. Passages are ranked by BM25
+    against the question, near-duplicates of higher-ranked passages are dropped,
+    and the rest are taken greedily while they fit. Returns the packed context,
+    grouped by source in their original order, and a report of what was
+    included and dropped.
+    """
+    config = _config()
+    started = time.perf_counter()
+    candidates = []
+    for order, (kind, name, text) in enumerate(sources):
+        for position, passage in enumerate(_passages(text, config["MAX_PASSAGE_TOKENS"])):
+            candidates.append({
+                "kind": kind, "source": name, "order": (order, position),
+                "text": passage, "tokens": count_tokens(passage),
+            })
+
+    scores = BM25Index.build([c["text"] for c in candidates]).scores(question)
+    for i, candidate in enumerate(candidates):
+        candidate["score"] = round(scores.get(i, 0.0), 3)
+    # Ties (e.g. no lexical match at all) keep each source's own order, overview first
+    ranked = sorted(candidates, key=lambda c: (-c["score"], c["order"][1], c["order"][0]))
+
+    packed, dropped, kept_shingles = [], [], []
+    used = 0
+    for candidate in ranked:
+        shingles = _shingles(candidate["text"])
+        if any(_similarity(shingles, kept) >= config["DUPLICATE_SIMILARITY"] for kept in kept_shingles):
+            dropped.append({**candidate, "reason": "duplicate"})
+        elif used + candidate["tokens"] > budget:
+            dropped.append({**candidate, "reason": "budget"})
+        else:
+            packed.append(candidate)
+            kept_shingles.append(shingles)
+            used += candidate["tokens"]
+
+    sections = {"file": [], "url": []}
+    current = None
+    for candidate in sorted(packed, key=lambda c: c["order"]):
+        header = (candidate["kind"], candidate["source"])
+        text = candidate["text"]
+        if header != current and candidate["source"]:
+            label = "From file" if candidate["kind"] == "file" else "From URL"
+            text = f"[{label}: {candidate['source']}]\n{text}"
+        current = header
+        sections[candidate["kind"]].append(text)
+
+    context = []
+    if sections["file"]:
+        context.append("File Context:\n" + "\n\n".join(sections["file"]))
+    if sections["url"]:
+        context.append("URL Context:\n" + "\n\n".join(sections["url"]))
+
+    fields = ("kind", "source", "tokens", "score", "reason")
+    report = {
+        "budget": budget,
+        "tokens": used,
+        "candidate_tokens": sum(c["tokens"] for c in candidates),
+        "included": [{k: c[k] for k in fields if k in c} for c in packed],
+        "dropped": [{k: c[k] for k in fields if k in c} for c in dropped],
+    }
+    for c in dropped:
+        inc("context_passages_dropped_total", reason=c["reason"])
+    record("context_pack", time.perf_counter() - started, {},
+           included=len(packed), dropped=len(dropped), tokens=used, budget=budget)
+    print(f"📦 Packed {len(packed)}/{len(candidates)} passages ({used}/{budget} tokens, "
+          f"{sum(c['reason'] == 'duplicate' for c in dropped)} duplicates dropped)")
+    return "\n\n".join(context), report
@@ -0,0 +1,221 @@
+import multiprocessing
+import os
+import re
+import signal
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .tracing import inc, record
+
+
+DEFAULTS = {
+    "WORKERS": None,  # defaults to the number of cores
+    "PAGES_PER_TASK": 8,
+    "TIMEOUT": 300,  # seconds per document
+    "MEMORY_LIMIT_MB": 1024,  # address-space cap for each PDF worker process
+    "MAX_CHARS": 20_000_000,
+}
+TEXT_BLOCK_CHARS = 1 << 20
+# MuPDF reports a failed allocation as a plain RuntimeError, e.g. "code=2: calloc (...) failed"
+ALLOCATION_ERROR_RE = re.compile(r"\b(?:malloc|calloc|realloc)\b|out of memory", re.I)
+
+
+class ExtractionError(ValueError):
+    pass
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "EXTRACTION", {})}
+
+
+# ---------------------- PDF WORKERS ----------------------
+# These run in spawned processes, so they only import what they need.
+def _limit_memory(limit_mb):
+    if not limit_mb:
+        return
+    try:
+        import resource
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (limit_mb * 1024 * 1024, hard))
+    except (ImportError, ValueError, OSError):
+        pass  # not supported on this platform
+
+
+def _pdf_page_count(file_path):
+    import fitz
+    with fitz.open(file_path) as pdf:
+        return pdf.page_count
+
+
+def _pdf_pages(file_path, start, stop):
+    import fitz
+    try:
+        with fitz.open(file_path) as pdf:
+            return [pdf[i].get_text() for i in range(start, stop)]
+    except RuntimeError as e:
+        # Under the worker's RLIMIT_AS this is the memory limit, not a broken PDF
+        if ALLOCATION_ERROR_RE.search(str(e)):
+            raise MemoryError(str(e)) from None
+        raise
+
+
+class WorkerContext:
+    """A spawn context that keeps every worker process started through it.
+
+    ProcessPoolExecutor starts its workers with ``mp_context.Process``, so this
+    gives us their exit codes and ``terminate()`` without the executor's internals.
+    """
+
+    def __init__(self):
+        self._spawn = multiprocessing.get_context("spawn")
+        self.processes = []
+
+    def Process(self, *args, **kwargs):
+        process = self._spawn.Process(*args, **kwargs)
+        self.processes.append(process)
+        return process
+
+    def __getattr__(self, name):
+        return getattr(self._spawn, name)
+
+
+def _start_pool(config, tasks):
+    # One pool per document, so a timeout or crash only takes down that document's workers
+    workers = min(config["WORKERS"] or os.cpu_count() or 1, tasks)
+    context = WorkerContext()
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_limit_memory,
+        initargs=(config["MEMORY_LIMIT_MB"],),
+    )
+    return pool, workers, context.processes
+
+
+def _stop_pool(pool, processes, kill=False):
+    if kill:
+        # A timed-out worker may still be busy and would keep its memory until it finishes
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    pool.shutdown(wait=not kill, cancel_futures=True)
+
+
+def _crash_cause(processes):
+    for process in processes:
+        code = process.exitcode
+        if code is None or code in (0, -signal.SIGTERM):
+            continue  # still running, or stopped by the pool after the crash
+        if code < 0:
+            name = signal.Signals(-code).name
+            if -code == signal.SIGKILL:
+                return f"was killed by {name}, most likely by the system running out of memory"
+            return f"was killed by {name}"
+        return f"exited with code {code}"
+    return "stopped unexpectedly"
+
+
+def iter_pdf_pages(file_path, config=None):
+    config = config or _config()
+    count = _pdf_page_count(file_path)
+    step = config["PAGES_PER_TASK"]
+    if count <= step:
+        yield from _pdf_pages(file_path, 0, count)
+        return
+
+    ranges = [(start, min(start + step, count)) for start in range(0, count, step)]
+    pool, workers, processes = _start_pool(config, len(ranges))
+    deadline = time.monotonic() + config["TIMEOUT"]
+    ranges = iter(ranges)
+    pending = deque()
+
+    def submit_next():
+        page_range = next(ranges, None)
+        if page_range:
+            pending.append(pool.submit(_pdf_pages, file_path, *page_range))
+
+    # Keep only a couple of batches per worker in flight so memory stays bounded
+    for _ in range(workers * 2):
+        submit_next()
+
+    failed = True
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise FutureTimeoutError()
+            pages = pending.popleft().result(timeout=remaining)
+            submit_next()
+            yield from pages
+        failed = False
+    except FutureTimeoutError:
+        raise ExtractionError(f"PDF extraction timed out after {config['TIMEOUT']}s.")
+    except MemoryError:
+        raise ExtractionError(f"PDF extraction exceeded the {config['MEMORY_LIMIT_MB']} MB memory limit.")
+    except BrokenProcessPool:
+        raise ExtractionError(f"A PDF extraction worker {_crash_cause(processes)}.")
+    finally:
+        _stop_pool(pool, processes, kill=failed)
+
+
+# ---------------------- STREAMING EXTRACTION ----------------------
+def _iter_sections(file_path, config):
+    if file_path.endswith(".txt"):
+        with open(file_path, "r", encoding="utf-8") as f:
+            while True:
+                block = f.read(TEXT_BLOCK_CHARS)
+                if not block:
+                    break
+                yield block
+
+    elif file_path.endswith(".pdf"):
+        yield from iter_pdf_pages(file_path, config)
+
+    elif file_path.endswith(".docx"):
+        import docx
+        doc = docx.Document(file_path)
+        for i, para in enumerate(doc.paragraphs):
+            yield para.text if i == 0 else "\n" + para.text
+
+    elif file_path.endswith(".pptx"):
+        import pptx
+        prs = pptx.Presentation(file_path)
+        for slide in prs.slides:
+            yield "".join(shape.text + "\n" for shape in slide.shapes if hasattr(shape, "text"))
+
+    else:
+        yield "Unsupported file type."
+
+
+def iter_text_from_file(file_path):
+    """Yield the document's text a page, slide or block at a time."""
+    config = _config()
+    file_type = os.path.splitext(file_path)[1].lstrip(".").lower() or "none"
+    sections = _iter_sections(file_path, config)
+    total = 0
+    # Only time spent producing sections counts, not the caller's work between them
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            section = next(sections, None)
+            elapsed += time.perf_counter() - started
+            if section is None:
+                break
+            total += len(section)
+            if total > config["MAX_CHARS"]:
+                raise ExtractionError(f"Document has more than {config['MAX_CHARS']} characters of text.")
+            yield section
+    except Exception:
+        inc("extraction_errors_total", type=file_type)
+        raise
+    record("extraction", elapsed, {"type": file_type}, chars=total)
+
+
+def extract_text_from_file(file_path):
+    return "".join(iter_text_from_file(file_path))
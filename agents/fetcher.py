@@ -0,0 +1,87 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from .tracing import inc
+
+
+DEFAULTS = {
+    "MAX_WORKERS": 16,  # fetches in flight across all hosts
+    "PER_HOST": 4,  # fetches in flight to any one host
+    "DEADLINE": 30,  # seconds for a whole batch; slower URLs are reported as timed out
+}
+
+_lock = threading.Lock()
+_executor = None
+_host_slots = {}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "URL_FETCH", {})}
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_config()["MAX_WORKERS"], thread_name_prefix="fetch")
+        return _executor
+
+
+def _host_slot(url):
+    host = urlsplit(url).netloc.lower()
+    with _lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(_config()["PER_HOST"])
+        return _host_slots[host]
+
+
+def _fetch_one(fetch, url, deadline, args):
+    slot = _host_slot(url)
+    # Waiting for a host slot counts against the deadline too
+    if not slot.acquire(timeout=max(deadline - time.monotonic(), 0)):
+        raise TimeoutError("Deadline passed while waiting for a connection to this host.")
+    try:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Deadline passed before the fetch started.")
+        return fetch(url, *args, timeout=remaining)
+    finally:
+        slot.release()
+
+
+def fetch_many(fetch, requests, deadline=None):
+    """Run ``fetch(url, *args, timeout=...)`` for each ``(url, args)`` concurrently.
+
+    At most URL_FETCH['PER_HOST'] fetches go to one host at a time. Whatever has
+    not finished when the deadline passes is reported as a TimeoutError, so one
+    slow site cannot hold up the rest. Returns ``(result, error)`` pairs in the
+    order of ``requests``.
+    """
+    deadline = time.monotonic() + (deadline or _config()["DEADLINE"])
+    executor = _get_executor()
+    futures = [
+        executor.submit(contextvars.copy_context().run, _fetch_one, fetch, url, deadline, args)
+        for url, args in requests
+    ]
+    wait(futures, timeout=max(deadline - time.monotonic(), 0))
+
+    results = []
+    for future in futures:
+        if not future.done():
+            # Queued fetches are dropped; running ones finish in the background and are ignored
+            future.cancel()
+            results.append((None, TimeoutError("Fetch did not finish before the deadline.")))
+        elif future.exception() is not None:
+            results.append((None, future.exception()))
+        else:
+            results.append((future.result(), None))
+    failed = sum(1 for _, error in results if error is not None)
+    inc("fetch_batch_urls_total", len(results) - failed, result="ok")
+    inc("fetch_batch_urls_total", failed, result="error")
+    print(f"🌐 Fetched {len(results) - failed}/{len(results)} URL(s)")
+    return results
@@ -0,0 +1,412 @@
+import hashlib
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+from .chunking import get_model_budget
+from .extraction import iter_text_from_file
+from .fetcher import fetch_many
+from .models import Document, IngestionJob, Summary
+from .retrieval import index_chunks
+from .scheduler import BACKGROUND, priority
+from .store import (
+    add_to_corpus, get_chunks, get_session_key, release_file, replace_chunks, save_document, update_summaries_digest,
+)
+from .summarizer import summarize_chunks
+from .summary_tree import build_summary_tree
+from .utils import extract_text_chunks, fetch_url_if_modified, get_llm, iter_text_chunks
+
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+FILE_PROMPT = "Context:\n{chunk}\n\nSummarize this chunk."
+URL_PROMPT = "Summarize this chunk:\n\n{chunk}"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, "INGESTION_WORKERS", 2)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingestion")
+        return _executor
+
+
+# ---------------------- QUEUE ----------------------
+def _create_job(request, kind, name, prompt, path="", document=None):
+    job = IngestionJob.objects.create(
+        document=document,
+        session_key=get_session_key(request),
+        kind=kind,
+        name=name,
+        path=path,
+        prompt=prompt,
+        model_name=request.session.get("model_name") or "",
+        api_key=request.session.get("api_key") or "",
+        rules=request.session.get("rules", []),
+    )
+    request.session["ingestion_jobs"] = request.session.get("ingestion_jobs", []) + [job.id]
+    request.session.modified = True
+    print(f"📥 Queued ingestion job {job.id} for {name}")
+    return job
+
+
+def enqueue_job(request, kind, name, prompt, path="", document=None):
+    job = _create_job(request, kind, name, prompt, path, document)
+    _get_executor().submit(run_job, job.id)
+    return job
+
+
+def enqueue_url_jobs(request, names, documents=None):
+    """Queue one job per URL and fetch their pages together; ``documents`` maps names to documents to refresh."""
+    documents = documents or {}
+    jobs = [_create_job(request, Document.URL, name, URL_PROMPT, document=documents.get(name)) for name in names]
+    _get_executor().submit(fetch_jobs, [job.id for job in jobs])
+    return jobs
+
+
+def resume_jobs():
+    """Requeue pending jobs and running jobs whose worker stopped sending heartbeats."""
+    stale = getattr(settings, "INGESTION_STALE_SECONDS", 900)
+    cutoff = timezone.now() - timedelta(seconds=stale)
+    try:
+        IngestionJob.objects.filter(status=IngestionJob.RUNNING, updated_at__lt=cutoff).update(
+            status=IngestionJob.PENDING, worker="",
+        )
+        job_ids = list(IngestionJob.objects.filter(status=IngestionJob.PENDING).values_list("id", flat=True))
+    except Exception as e:
+        # e.g. migrations have not been applied yet
+        print(f"⚠️ Could not resume ingestion jobs: {e}")
+        return
+    finally:
+        connection.close()
+
+    for job_id in job_ids:
+        _get_executor().submit(run_job, job_id)
+    if job_ids:
+        print(f"🔁 Resuming {len(job_ids)} ingestion job(s)")
+
+
+# ---------------------- WORKER ----------------------
+@contextmanager
+def _heartbeat(job_ids):
+    """Touch the running jobs' ``updated_at`` while the block runs, so a long extraction is not taken for stale."""
+    interval = getattr(settings, "INGESTION_HEARTBEAT_SECONDS", 30)
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                IngestionJob.objects.filter(pk__in=job_ids, status=IngestionJob.RUNNING, worker=WORKER_ID).update(
+                    updated_at=timezone.now(),
+                )
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name="ingestion-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _finish(job_ids, status, error=""):
+    # The API key is only needed while the job runs; finished jobs do not keep it.
+    # Jobs cancelled while they ran stay cancelled; returns how many were finished.
+    return IngestionJob.objects.filter(pk__in=job_ids, status=IngestionJob.RUNNING).update(
+        status=status, error=error, api_key="", updated_at=timezone.now(),
+    )
+
+
+def cancel_jobs(session_key):
+    """Cancel the session's pending and running jobs, so none of them attaches a document later."""
+    return IngestionJob.objects.filter(
+        session_key=session_key, status__in=[IngestionJob.PENDING, IngestionJob.RUNNING],
+    ).update(status=IngestionJob.CANCELLED, api_key="", updated_at=timezone.now())
+
+
+def _discard(job):
+    # A job cancelled while it ran drops what it produced; its session no longer wants it
+    document = job.document
+    if document is None:
+        return
+    if job.kind == Document.FILE:
+        release_file(document)
+    else:
+        Document.objects.filter(pk=document.pk).delete()
+    print(f"🗑️ Ingestion job {job.id} was cancelled; discarded '{job.name}'")
+
+
+def run_job(job_id):
+    close_old_connections()
+    try:
+        claimed = IngestionJob.objects.filter(pk=job_id, status=IngestionJob.PENDING).update(
+            status=IngestionJob.RUNNING, worker=WORKER_ID, updated_at=timezone.now(),
+        )
+        if not claimed:
+            return  # another worker got it first
+
+        job = IngestionJob.objects.get(pk=job_id)
+        try:
+            # Ingestion yields the provider's rate budget to questions being answered
+            with priority(BACKGROUND), _heartbeat([job_id]):
+                _process(job)
+            finished = _finish([job_id], IngestionJob.DONE)
+            if finished:
+                print(f"✅ Ingestion job {job_id} finished")
+        except Exception as e:
+            print(f"❌ Ingestion job {job_id} failed: {e}")
+            finished = _finish([job_id], IngestionJob.FAILED, str(e))
+        if not finished:
+            _discard(job)
+    finally:
+        connection.close()
+
+
+def fetch_jobs(job_ids, queue=True):
+    """Fetch the pages of several URL jobs concurrently, then hand each job on for summarization.
+
+    Jobs whose page did not arrive before the batch deadline fail; the others
+    go back to pending with their page stored, and are queued unless ``queue``
+    is false.
+    """
+    close_old_connections()
+    try:
+        jobs = []
+        for job_id in job_ids:
+            if IngestionJob.objects.filter(pk=job_id, status=IngestionJob.PENDING).update(
+                status=IngestionJob.RUNNING, worker=WORKER_ID, updated_at=timezone.now(),
+            ):
+                jobs.append(IngestionJob.objects.select_related("document").get(pk=job_id))
+
+        with _heartbeat([job.id for job in jobs]):
+            results = fetch_many(fetch_url_if_modified, [(job.name, _validators(job)) for job in jobs])
+        for job, (fetched, error) in zip(jobs, results):
+            try:
+                if error is not None:
+                    raise error
+                _store_url(job, get_model_budget(job.model_name), *fetched)
+                job.fetched = True
+                job.save(update_fields=["document", "fetched", "updated_at"])
+            except Exception as e:
+                print(f"❌ Ingestion job {job.id} failed: {e}")
+                if not _finish([job.id], IngestionJob.FAILED, str(e) or type(e).__name__):
+                    _discard(job)
+                continue
+            if not IngestionJob.objects.filter(pk=job.id, status=IngestionJob.RUNNING).update(
+                status=IngestionJob.PENDING, worker="",
+            ):
+                _discard(job)
+                continue
+            if queue:
+                _get_executor().submit(run_job, job.id)
+    finally:
+        connection.close()
+
+
+def _process(job):
+    llm = get_llm({"session": {"model_name": job.model_name, "api_key": job.api_key, "rules": job.rules}})
+
+    if not job.fetched:
+        if job.kind == Document.FILE:
+            _extract_file(job, llm.budget)
+        else:
+            _fetch_url(job, llm.budget)
+        job.fetched = True
+        job.save(update_fields=["document", "fetched", "updated_at"])
+
+    # Only summarize the chunks a previous run did not finish
+    document = job.document
+    chunks = get_chunks(document)
+    done = set(document.summaries.filter(level=0).values_list("position", flat=True))
+    missing = [position for position in range(len(chunks)) if position not in done]
+    IngestionJob.objects.filter(pk=job.pk).update(
+        total_chunks=len(chunks), done_chunks=len(done), updated_at=timezone.now(),
+    )
+    try:
+        if missing:
+            _summarize_missing(job, llm, document, chunks, missing)
+
+        # Summaries of summaries, up to one for the whole document
+        build_summary_tree(document, llm, provider=job.model_name)
+    finally:
+        # Once per run rather than per summary; a failed run keeps the summaries it did write
+        update_summaries_digest(document)
+
+
+def _summarize_missing(job, llm, document, chunks, missing):
+    def on_result(i, text):
+        position = missing[i]
+        Summary.objects.update_or_create(
+            document=document, level=0, position=position,
+            defaults={"text": text, "chunk_start": position, "chunk_end": position + 1},
+        )
+        IngestionJob.objects.filter(pk=job.pk).update(done_chunks=F("done_chunks") + 1, updated_at=timezone.now())
+
+    summarize_chunks(
+        llm, [chunks[position] for position in missing],
+        lambda chunk: job.prompt.replace("{chunk}", chunk),
+        provider=job.model_name, on_result=on_result,
+    )
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _extract_file(job, budget):
+    chunks = list(iter_text_chunks(iter_text_from_file(job.path), budget))
+    # Files belong to no single session; corpora link to them once the job is done
+    job.document = save_document(
+        "", job.kind, job.name, chunks,
+        path=job.path, index_key=index_chunks(chunks), replace=False,
+        content_hash=_file_hash(job.path), chunk_tokens=budget["chunk_tokens"],
+    )
+
+
+def _validators(job):
+    document = job.document
+    return (document.etag, document.last_modified) if document is not None else ()
+
+
+def _fetch_url(job, budget):
+    _store_url(job, budget, *fetch_url_if_modified(job.name, *_validators(job)))
+
+
+def _store_url(job, budget, text, headers):
+    document = job.document
+    if text is None:
+        print(f"✅ {job.name} not modified (304)")
+        Document.objects.filter(pk=document.pk).update(
+            etag=headers.get("ETag", document.etag),
+            last_modified=headers.get("Last-Modified", document.last_modified),
+            fetched_at=timezone.now(),
+        )
+        return
+
+    validators = {
+        "etag": headers.get("ETag", ""),
+        "last_modified": headers.get("Last-Modified", ""),
+        "fetched_at": timezone.now(),
+    }
+
+    if not text.strip():
+        raise ValueError("The link was fetched, but no usable text was found.")
+
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    if document is not None and document.content_hash == content_hash:
+        print(f"✅ {job.name} unchanged (same content hash)")
+        Document.objects.filter(pk=document.pk).update(**validators)
+        return
+
+    chunks = extract_text_chunks(text, budget)
+    if document is None:
+        job.document = save_document(
+            job.session_key, job.kind, job.name, chunks,
+            index_key=index_chunks(chunks), content_hash=content_hash, **validators,
+        )
+    else:
+        reused = replace_chunks(document, chunks, index_chunks(chunks), content_hash=content_hash, **validators)
+        print(f"🔁 {job.name} changed: reusing {reused}/{len(chunks)} chunk summaries")
+
+
+def refresh_urls(request):
+    """Queue a conditional refresh of every URL attached to the session, fetched as one batch."""
+    documents = Document.objects.in_bulk(list(request.session.get("url_documents", {}).values()))
+    by_name = {document.name: document for document in documents.values()}
+    if by_name:
+        enqueue_url_jobs(request, list(by_name), by_name)
+    return len(by_name)
+
+
+def refresh_stale_urls(max_age):
+    """Refresh URL documents fetched more than ``max_age`` seconds ago.
+
+    Each refresh uses the model, API key and rules currently set in the
+    document's session; URLs whose session has expired or has no key are skipped.
+    """
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    job_ids = []
+    for document in Document.objects.filter(kind=Document.URL, fetched_at__lt=cutoff):
+        session = store(session_key=document.session_key) if document.session_key else {}
+        if not session.get("model_name") or not session.get("api_key"):
+            continue
+        job = IngestionJob.objects.create(
+            session_key=document.session_key, kind=Document.URL, name=document.name, prompt=URL_PROMPT,
+            model_name=session["model_name"], api_key=session["api_key"], rules=session.get("rules", []),
+            document=document,
+        )
+        job_ids.append(job.id)
+
+    # Fetch every page at once, then summarize whatever changed
+    fetch_jobs(job_ids, queue=False)
+    for job_id in IngestionJob.objects.filter(pk__in=job_ids, status=IngestionJob.PENDING).values_list("id", flat=True):
+        run_job(job_id)
+    return len(job_ids)
+
+
+# ---------------------- SESSION SYNC ----------------------
+def job_payload(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "name": job.name,
+        "status": job.status,
+        "total_chunks": job.total_chunks,
+        "done_chunks": job.done_chunks,
+        "progress": (job.done_chunks / job.total_chunks) if job.total_chunks else 0.0,
+        "error": job.error,
+        "document_id": job.document_id,
+    }
+
+
+def sync_jobs(request):
+    """Attach finished jobs' documents to the session and return the jobs still in progress."""
+    job_ids = request.session.get("ingestion_jobs", [])
+    if not job_ids:
+        return []
+
+    active = []
+    for job in IngestionJob.objects.filter(pk__in=job_ids).order_by("id"):
+        if job.status == IngestionJob.DONE and job.document_id:
+            if job.kind == Document.FILE:
+                add_to_corpus(request, job.document, job.name)
+            else:
+                rag_links = request.session.get("rag_links", [])
+                if job.name not in rag_links:
+                    rag_links.append(job.name)
+                url_documents = request.session.get("url_documents", {})
+                url_documents[job.name] = job.document_id
+                request.session["rag_links"] = rag_links
+                request.session["url_documents"] = url_documents
+            messages.success(request, f"✅ '{job.name}' processed ({job.total_chunks} chunks).")
+        elif job.status == IngestionJob.FAILED:
+            messages.error(request, f"❌ Failed to process '{job.name}': {job.error}")
+        elif job.status == IngestionJob.CANCELLED:
+            continue
+        else:
+            active.append(job)
+
+    request.session["ingestion_jobs"] = [job.id for job in active]
+    request.session.modified = True
+    return active
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from langchain_core.messages import AIMessage
+
+from .chunking import count_tokens
+from .tracing import inc, span
+
+
+DEFAULTS = {
+    "ENABLED": True,
+    "PATH": "llm_cache.sqlite3",
+    "TTL": 7 * 24 * 3600,
+    "MAX_ENTRIES": 20000,
+    "MAX_BYTES": 200 * 1024 * 1024,
+}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "LLM_CACHE", {})}
+
+
+def make_key(model, system_prompt, messages, scope=None):
+    payload = [[type(msg).__name__, msg.content] for msg in messages]
+    digest = hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+    parts = [model or "", system_prompt or "", digest]
+    if scope:
+        parts.append(hashlib.sha256(scope.encode("utf-8")).hexdigest())
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+# ---------------------- SQLITE STORE ----------------------
+class LLMCache:
+    def __init__(self, path, ttl, max_entries, max_bytes):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._setup()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _setup(self):
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at);
+            CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache (created_at);
+        """)
+
+    def get(self, key):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT content FROM llm_cache WHERE key = ? AND created_at > ?",
+            (key, now - self.ttl),
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, model, content):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, model, content, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model or "", content, len(content.encode("utf-8")), now, now),
+        )
+        self.evict()
+
+    def evict(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM llm_cache WHERE created_at <= ?", (time.time() - self.ttl,))
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Least recently used first until we are back under both caps
+        removed = 0
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+            removed += 1
+        print(f"🧹 Evicted {removed} LLM cache entries")
+
+    def clear(self):
+        self._conn().execute("DELETE FROM llm_cache")
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        count, total = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": total,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    config = _config()
+    if not config["ENABLED"]:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = config["PATH"]
+            if not os.path.isabs(path):
+                path = os.path.join(settings.BASE_DIR, path)
+            _cache = LLMCache(path, config["TTL"], config["MAX_ENTRIES"], config["MAX_BYTES"])
+        return _cache
+
+
+# ---------------------- CACHED LLM ----------------------
+class CachedLLM:
+    def __init__(self, llm, model, system_prompt=None, scope=None, budget=None):
+        self.llm = llm
+        self.model = model
+        self.system_prompt = system_prompt
+        self.scope = scope
+        self.budget = budget  # {"context_tokens": ..., "chunk_tokens": ...}
+
+    def _record(self, current, messages, content):
+        prompt = "".join(msg.content for msg in messages)
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(content)
+        current.set(
+            prompt_chars=len(prompt), response_chars=len(content),
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+        )
+        if current.labels["cache"] != "hit":
+            inc("llm_prompt_tokens_total", prompt_tokens, model=self.model)
+            inc("llm_completion_tokens_total", completion_tokens, model=self.model)
+
+    def invoke(self, messages):
+        with span("llm_call", model=self.model, cache="off") as current:
+            cache = get_cache()
+            if cache is None:
+                response = self.llm.invoke(messages)
+                self._record(current, messages, response.content)
+                return response
+
+            key = make_key(self.model, self.system_prompt, messages, self.scope)
+            content = cache.get(key)
+            if content is not None:
+                current.labels["cache"] = "hit"
+                self._record(current, messages, content)
+                return AIMessage(content=content)
+
+            current.labels["cache"] = "miss"
+            response = self.llm.invoke(messages)
+            cache.set(key, self.model, response.content)
+            self._record(current, messages, response.content)
+            return response
+
+    def stream(self, messages):
+        with span("llm_call", model=self.model, cache="off") as current:
+            cache = get_cache()
+            key = None
+            if cache is not None:
+                key = make_key(self.model, self.system_prompt, messages, self.scope)
+                content = cache.get(key)
+                if content is not None:
+                    current.labels["cache"] = "hit"
+                    self._record(current, messages, content)
+                    yield AIMessage(content=content)
+                    return
+                current.labels["cache"] = "miss"
+
+            parts = []
+            for chunk in self.llm.stream(messages):
+                parts.append(chunk.content or "")
+                yield chunk
+            content = "".join(parts)
+            if cache is not None:
+                cache.set(key, self.model, content)
+            self._record(current, messages, content)
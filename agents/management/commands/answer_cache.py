@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from agents import answer_cache
+
+
+class Command(BaseCommand):
+    help = "Show answer cache statistics, or evict/clear entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--evict", action="store_true", help="Drop expired entries and enforce the size cap")
+        parser.add_argument("--clear", action="store_true", help="Remove every cached answer")
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            answer_cache.clear()
+            self.stdout.write("✅ Answer cache cleared.")
+        elif options["evict"]:
+            answer_cache.evict()
+
+        for name, value in answer_cache.stats().items():
+            self.stdout.write(f"{name}: {value}")
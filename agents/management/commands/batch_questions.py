@@ -0,0 +1,44 @@
+import json
+import sys
+from importlib import import_module
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from agents.batch import answer_batch
+
+
+class Command(BaseCommand):
+    help = "Answer many questions against a session's corpus at once, printing one JSON line per answer."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "questions",
+            help="File with one question per line, or JSON lines with a \"question\" field ('-' for stdin)",
+        )
+        parser.add_argument("--session", required=True, help="Session key whose corpus, URLs, model and rules to use")
+        parser.add_argument(
+            "--document", action="append", dest="documents", type=int, default=[],
+            help="Only use this corpus document id (repeatable; default: the whole corpus)",
+        )
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not store().exists(options["session"]):
+            raise CommandError(f"No session {options['session']}.")
+        request = SimpleNamespace(session=store(session_key=options["session"]))
+
+        source = sys.stdin if options["questions"] == "-" else open(options["questions"], encoding="utf-8")
+        with source:
+            questions = [self._question(line) for line in source if line.strip()]
+
+        for line in answer_batch(request, [q for q in questions if q], options["documents"]):
+            self.stdout.write(json.dumps(line))
+
+    @staticmethod
+    def _question(line):
+        line = line.strip()
+        if line.startswith("{"):
+            return (json.loads(line).get("question") or "").strip()
+        return line
@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from agents import utils
+from agents.benchmark import (
+    make_fixtures, make_pages, run_fetch_scenarios, run_parse_scenarios, run_scenarios, stub_server,
+)
+
+
+class Command(BaseCommand):
+    help = "Run the ingestion and question pipeline offline against a local stub LLM server and report timings."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model", action="append", choices=["llama3", "gpt4", "mistral"],
+            help="Model(s) to benchmark (default: gpt4 and mistral, covering both provider APIs)",
+        )
+        parser.add_argument("--pages", type=int, default=20, help="Pages per fixture document (default: 20)")
+        parser.add_argument("--latency", type=float, default=0.05, help="Stub seconds before the first token")
+        parser.add_argument("--tokens-per-second", type=float, default=200, help="Stub generation speed")
+        parser.add_argument("--completion-tokens", type=int, default=64, help="Tokens per stub reply")
+        parser.add_argument("--rpm", type=int, default=0,
+                            help="Stub requests per minute before it answers 429 with Retry-After (default: no limit)")
+        parser.add_argument("--timeout", type=int, default=600, help="Seconds to wait for each ingestion")
+        parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+
+    def handle(self, *args, **options):
+        models = options["model"] or ["gpt4", "mistral"]
+
+        # Everything runs against a throwaway database, media directory and disabled response cache.
+        # The database is a file so ingestion threads see the same data without shared-cache locking.
+        with tempfile.TemporaryDirectory() as media_root:
+            setup_test_environment()
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(media_root, "benchmark.sqlite3")
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                with stub_server(options["latency"], options["tokens_per_second"], options["completion_tokens"],
+                                 make_pages(options["pages"]), options["rpm"]) as server:
+                    fixtures = make_fixtures(media_root, options["pages"])
+                    endpoints = {
+                        "llama3": f"{server.url}/openai/v1",
+                        "gpt4": f"{server.url}/openai/v1",
+                        "mistral": f"{server.url}/mistral/v1",
+                    }
+                    with override_settings(MEDIA_ROOT=media_root, LLM_ENDPOINTS=endpoints,
+                                           LLM_CACHE={"ENABLED": False}):
+                        results = run_parse_scenarios(server) + run_fetch_scenarios(server)
+                        for model in models:
+                            utils._llm_clients.clear()
+                            results += run_scenarios(server, model, fixtures, options["timeout"])
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        if options["json"]:
+            for row in results:
+                self.stdout.write(json.dumps(row))
+            return
+
+        self.stdout.write(
+            f"{'scenario':<60} {'wall s':>8} {'calls':>6} {'prompt':>8} {'compl':>7} {'429s':>5} "
+            f"{'peak MB':>8} {'rss MB':>8}"
+        )
+        for row in results:
+            self.stdout.write(
+                f"{row['scenario']:<60} {row['wall_seconds']:>8.2f} {row['llm_calls']:>6} "
+                f"{row['prompt_tokens']:>8} {row['completion_tokens']:>7} {row['rate_limited']:>5} "
+                f"{row['peak_python_mb']:>8.2f} {row['max_rss_mb']:>8.1f}"
+            )
+            if row["error"]:
+                self.stdout.write(self.style.ERROR(f"    ❌ {row['error']}"))
@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+HEAVY_MODULES = [
+    "fitz", "docx", "pptx", "bs4", "tiktoken", "httpx",
+    "langgraph", "langchain", "langchain_community", "langchain_core", "openai",
+]
+
+# Runs in a fresh interpreter so nothing is already imported
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+for name in sys.argv[1:]:
+    __import__(name)
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "loaded": sorted(m for m in %r if m in sys.modules),
+}))
+""" % (HEAVY_MODULES,)
+
+
+class Command(BaseCommand):
+    help = "Profile what a cold worker imports at startup (python -X importtime) and which heavy packages it loads."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "modules", nargs="*", default=["agents.views", "agents.jobs"],
+            help="Modules a worker imports at boot (default: agents.views agents.jobs)",
+        )
+        parser.add_argument("--top", type=int, default=20, help="Number of top-level packages to list")
+
+    def handle(self, *args, **options):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "genie_project.settings")}
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE, *options["modules"]],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if process.returncode != 0:
+            self.stderr.write(process.stderr[-2000:])
+            return
+
+        # "import time: self [us] | cumulative | imported package"; nested imports are indented
+        packages = {}
+        for line in process.stderr.splitlines():
+            if not line.startswith("import time:") or "imported package" in line:
+                continue
+            self_us, _, name = line[len("import time:"):].split("|")
+            top = name.strip().split(".", 1)[0]
+            packages[top] = packages.get(top, 0) + int(self_us)
+
+        report = json.loads(process.stdout.strip().splitlines()[-1])
+        self.stdout.write(f"⏱️ Startup imports: {report['seconds'] * 1000:.0f} ms, max RSS {report['max_rss_kb'] / 1024:.1f} MB")
+        self.stdout.write(f"📦 Heavy packages loaded at boot: {', '.join(report['loaded']) or 'none'}")
+        self.stdout.write(f"{'package':<32} {'self ms':>10}")
+        for name, micros in sorted(packages.items(), key=lambda item: -item[1])[:options["top"]]:
+            self.stdout.write(f"{name:<32} {micros / 1000:>10.1f}")
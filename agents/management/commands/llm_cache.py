@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from agents.llm_cache import get_cache
+
+
+class Command(BaseCommand):
+    help = "Show LLM response cache statistics, or evict/clear entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--evict", action="store_true", help="Drop expired entries and enforce size caps")
+        parser.add_argument("--clear", action="store_true", help="Remove every cached response")
+
+    def handle(self, *args, **options):
+        cache = get_cache()
+        if cache is None:
+            self.stdout.write("LLM cache is disabled.")
+            return
+
+        if options["clear"]:
+            cache.clear()
+            self.stdout.write("✅ LLM cache cleared.")
+        elif options["evict"]:
+            cache.evict()
+
+        for name, value in cache.stats().items():
+            self.stdout.write(f"{name}: {value}")
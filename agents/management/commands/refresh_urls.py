@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from agents.jobs import refresh_stale_urls
+
+
+class Command(BaseCommand):
+    help = "Conditionally re-fetch linked URLs and re-summarize only the chunks that changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than", type=int, default=3600,
+            help="Only refresh URLs last fetched more than this many seconds ago (default: 3600)",
+        )
+
+    def handle(self, *args, **options):
+        refreshed = refresh_stale_urls(options["older_than"])
+        self.stdout.write(f"✅ Checked {refreshed} URL(s).")
@@ -0,0 +1,79 @@
+from django.conf import settings
+from langchain_core.messages import HumanMessage
+
+from .models import ConversationMemory, ConversationTurn
+
+
+DEFAULTS = {
+    "MAX_TURNS": 200,
+    "RECENT_TURNS": 4,
+    "PAGE_SIZE": 10,
+    "SUMMARY_WORDS": 250,
+}
+MAX_ANSWER_CHARS = 2000
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "CONVERSATION", {})}
+
+
+def _transcript(turns):
+    return "\n\n".join(f"Q: {turn.question}\nA: {turn.final_answer[:MAX_ANSWER_CHARS]}" for turn in turns)
+
+
+def get_memory(request):
+    """Compact chat memory: the rolling summary plus the turns not folded into it yet."""
+    session_key = request.session.session_key
+    if not session_key:
+        return ""
+    config = get_config()
+    memory = ConversationMemory.objects.filter(session_key=session_key).first()
+    last_turn_id = memory.last_turn_id if memory else 0
+
+    # Folding runs every RECENT_TURNS turns, so at most twice that many are still unfolded
+    turns = ConversationTurn.objects.filter(session_key=session_key, pk__gt=last_turn_id)
+    recent = list(turns.order_by("-pk")[:config["RECENT_TURNS"] * 2])[::-1]
+
+    parts = []
+    if memory and memory.summary:
+        parts.append("Earlier in the conversation:\n" + memory.summary)
+    if recent:
+        parts.append(_transcript(recent))
+    return "\n\n".join(parts)
+
+
+def update_memory(request, llm):
+    """Fold turns older than the recent window into the rolling summary, then cap stored history."""
+    session_key = request.session.session_key
+    if not session_key:
+        return
+    config = get_config()
+    memory, _ = ConversationMemory.objects.get_or_create(session_key=session_key)
+
+    unfolded = list(ConversationTurn.objects.filter(session_key=session_key, pk__gt=memory.last_turn_id).order_by("pk"))
+    older = unfolded[:-config["RECENT_TURNS"]]
+    # One summarization call per batch of turns rather than per turn
+    if len(older) < config["RECENT_TURNS"]:
+        return
+
+    prompt = (
+        f"Current summary of the conversation:\n{memory.summary or '(empty)'}\n\n"
+        f"New exchanges:\n{_transcript(older)}\n\n"
+        f"Rewrite the summary to include the new exchanges in at most {config['SUMMARY_WORDS']} words. "
+        "Keep facts, names, numbers and decisions the user may refer back to."
+    )
+    response = llm.invoke([HumanMessage(content=prompt)])
+    memory.summary = response.content
+    memory.last_turn_id = older[-1].pk
+    memory.save()
+    print(f"🧠 Folded {len(older)} turns into conversation memory")
+
+    # Only turns that are already in the summary may be dropped
+    cutoff = list(
+        ConversationTurn.objects.filter(session_key=session_key)
+        .order_by("-pk").values_list("pk", flat=True)[config["MAX_TURNS"] - 1:config["MAX_TURNS"]]
+    )
+    if cutoff:
+        ConversationTurn.objects.filter(
+            session_key=session_key, pk__lt=cutoff[0], pk__lte=memory.last_turn_id,
+        ).delete()
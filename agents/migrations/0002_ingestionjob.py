@@ -0,0 +1,42 @@
+# Generated by Django 5.1.1
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_key', models.CharField(max_length=40)),
+                ('kind', models.CharField(choices=[('file', 'File'), ('url', 'URL')], max_length=8)),
+                ('name', models.CharField(max_length=2048)),
+                ('path', models.CharField(blank=True, max_length=1024)),
+                ('prompt', models.TextField()),
+                ('model_name', models.CharField(max_length=32)),
+                ('api_key', models.CharField(max_length=256)),
+                ('rules', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=8)),
+                ('total_chunks', models.PositiveIntegerField(default=0)),
+                ('done_chunks', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=128)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='agents.document')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['session_key', 'status'], name='job_session_status_idx'),
+                    models.Index(fields=['status', 'updated_at'], name='job_status_updated_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_chunk_spans(apps, schema_editor):
+    Summary = apps.get_model('agents', 'Summary')
+    Summary.objects.filter(level=0).update(chunk_start=F('position'), chunk_end=F('position') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_url_refresh'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='chunk_start',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='chunk_end',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(set_chunk_spans, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0004_summary_chunk_span'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationMemory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_key', models.CharField(max_length=40, unique=True)),
+                ('summary', models.TextField(blank=True)),
+                ('last_turn_id', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0005_conversationmemory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('context_key', models.CharField(max_length=64)),
+                ('question_key', models.CharField(max_length=64)),
+                ('terms_key', models.CharField(max_length=64)),
+                ('question', models.TextField()),
+                ('retrieved_data', models.TextField(blank=True)),
+                ('summarized_data', models.TextField(blank=True)),
+                ('final_answer', models.TextField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('used_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['context_key', 'question_key'], name='answer_context_question_idx'),
+                    models.Index(fields=['context_key', 'terms_key'], name='answer_context_terms_idx'),
+                    models.Index(fields=['created_at'], name='answer_created_idx'),
+                ],
+            },
+        ),
+    ]
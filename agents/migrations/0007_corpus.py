@@ -0,0 +1,53 @@
+# Generated by Django 5.1.1
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0006_cachedanswer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='chunk_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['kind', 'content_hash', 'chunk_tokens'], name='document_content_idx'),
+        ),
+        migrations.CreateModel(
+            name='Corpus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'corpora',
+            },
+        ),
+        migrations.CreateModel(
+            name='CorpusDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('corpus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='agents.corpus')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='corpus_entries', to='agents.document')),
+            ],
+            options={
+                'ordering': ['added_at'],
+                'constraints': [models.UniqueConstraint(fields=('corpus', 'name'), name='corpus_document_name_uniq')],
+            },
+        ),
+        migrations.AddField(
+            model_name='corpus',
+            name='documents',
+            field=models.ManyToManyField(related_name='corpora', through='agents.CorpusDocument', to='agents.document'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def clear_finished_job_keys(apps, schema_editor):
+    # Finished jobs no longer keep the API key they ran with
+    IngestionJob = apps.get_model('agents', 'IngestionJob')
+    IngestionJob.objects.filter(status__in=['done', 'failed']).exclude(api_key='').update(api_key='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0007_corpus'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_finished_job_keys, migrations.RunPython.noop),
+    ]
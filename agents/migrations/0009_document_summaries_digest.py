@@ -0,0 +1,31 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_summaries_digest(apps, schema_editor):
+    # Same hash as store.summaries_digest, for documents summarized before the column existed
+    Document = apps.get_model('agents', 'Document')
+    Summary = apps.get_model('agents', 'Summary')
+    for document in Document.objects.filter(summaries__isnull=False).distinct().iterator():
+        digest = hashlib.sha256()
+        rows = Summary.objects.filter(document=document).order_by('level', 'position', 'text')
+        for level, position, text in rows.values_list('level', 'position', 'text'):
+            digest.update(f"{level}:{position}:{text}\x1e".encode("utf-8"))
+        Document.objects.filter(pk=document.pk).update(summaries_digest=digest.hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0008_clear_finished_job_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='summaries_digest',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.RunPython(fill_summaries_digest, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,170 @@
 from django.db import models
 
-# Create your models here.
+
+class Document(models.Model):
+    FILE = "file"
+    URL = "url"
+    KIND_CHOICES = [(FILE, "File"), (URL, "URL")]
+
+    session_key = models.CharField(max_length=40)
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    name = models.CharField(max_length=2048)  # file name, or the URL itself
+    path = models.CharField(max_length=1024, blank=True)
+    index_key = models.CharField(max_length=64, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    # Hash of the summary rows, kept current by store.update_summaries_digest for the answer-cache key
+    summaries_digest = models.CharField(max_length=64, blank=True)
+    # Files are shared across sessions by content_hash; chunks depend on the budget they were cut for
+    chunk_tokens = models.PositiveIntegerField(default=0)
+    # HTTP validators from the last fetch, for conditional refreshes of URLs
+    etag = models.CharField(max_length=256, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    fetched_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["session_key", "kind"], name="document_session_kind_idx"),
+            models.Index(fields=["kind", "fetched_at"], name="document_kind_fetched_idx"),
+            models.Index(fields=["kind", "content_hash", "chunk_tokens"], name="document_content_idx"),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Corpus(models.Model):
+    # One per session (or shared workspace); documents are linked in, never copied
+    key = models.CharField(max_length=64, unique=True)
+    documents = models.ManyToManyField(Document, through="CorpusDocument", related_name="corpora")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "corpora"
+
+    def __str__(self):
+        return self.key
+
+
+class CorpusDocument(models.Model):
+    corpus = models.ForeignKey(Corpus, related_name="entries", on_delete=models.CASCADE)
+    document = models.ForeignKey(Document, related_name="corpus_entries", on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)  # the name it was uploaded under in this corpus
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["added_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["corpus", "name"], name="corpus_document_name_uniq"),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Chunk(models.Model):
+    document = models.ForeignKey(Document, related_name="chunks", on_delete=models.CASCADE)
+    position = models.PositiveIntegerField()
+    text = models.TextField()
+
+    class Meta:
+        ordering = ["position"]
+        constraints = [
+            models.UniqueConstraint(fields=["document", "position"], name="chunk_document_position_uniq"),
+        ]
+
+
+class Summary(models.Model):
+    # level 0 summarizes the chunk at ``position``; higher levels summarize groups below them
+    document = models.ForeignKey(Document, related_name="summaries", on_delete=models.CASCADE)
+    level = models.PositiveSmallIntegerField(default=0)
+    position = models.PositiveIntegerField()
+    # Chunks covered by this node: [chunk_start, chunk_end)
+    chunk_start = models.PositiveIntegerField(default=0)
+    chunk_end = models.PositiveIntegerField(default=0)
+    text = models.TextField()
+
+    class Meta:
+        ordering = ["level", "position"]
+        constraints = [
+            models.UniqueConstraint(fields=["document", "level", "position"], name="summary_document_level_pos_uniq"),
+        ]
+
+
+class ConversationTurn(models.Model):
+    session_key = models.CharField(max_length=40)
+    question = models.TextField()
+    retrieved_data = models.TextField(blank=True)
+    summarized_data = models.TextField(blank=True)
+    final_answer = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["session_key", "created_at"], name="turn_session_created_idx"),
+        ]
+
+
+class ConversationMemory(models.Model):
+    # Rolling summary of every turn up to and including ``last_turn_id``
+    session_key = models.CharField(max_length=40, unique=True)
+    summary = models.TextField(blank=True)
+    last_turn_id = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class IngestionJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed"), (CANCELLED, "Cancelled"),
+    ]
+
+    session_key = models.CharField(max_length=40)
+    kind = models.CharField(max_length=8, choices=Document.KIND_CHOICES)
+    name = models.CharField(max_length=2048)
+    path = models.CharField(max_length=1024, blank=True)
+    prompt = models.TextField()  # uses "{chunk}" as the placeholder
+    model_name = models.CharField(max_length=32)
+    api_key = models.CharField(max_length=256)
+    rules = models.JSONField(default=list)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    total_chunks = models.PositiveIntegerField(default=0)
+    done_chunks = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    document = models.ForeignKey(Document, null=True, blank=True, on_delete=models.SET_NULL)
+    fetched = models.BooleanField(default=False)  # extraction / conditional fetch step finished
+    worker = models.CharField(max_length=128, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["session_key", "status"], name="job_session_status_idx"),
+            models.Index(fields=["status", "updated_at"], name="job_status_updated_idx"),
+        ]
+
+
+class CachedAnswer(models.Model):
+    # context_key covers corpus, model, rules and memory; the question keys are hashes of its normalized text
+    context_key = models.CharField(max_length=64)
+    question_key = models.CharField(max_length=64)
+    terms_key = models.CharField(max_length=64)
+    question = models.TextField()
+    retrieved_data = models.TextField(blank=True)
+    summarized_data = models.TextField(blank=True)
+    final_answer = models.TextField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    used_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["context_key", "question_key"], name="answer_context_question_idx"),
+            models.Index(fields=["context_key", "terms_key"], name="answer_context_terms_idx"),
+            models.Index(fields=["created_at"], name="answer_created_idx"),
+        ]
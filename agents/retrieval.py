@@ -0,0 +1,168 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+
+
+DEFAULT_TOP_K = 4
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i in is it its of on or that the
+this to was were what when where which who why will with you your do does did can
+""".split())
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# ---------------------- TOKENIZER ----------------------
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+# ---------------------- BM25 INDEX ----------------------
+class BM25Index:
+    def __init__(self, chunks, postings, lengths):
+        self.chunks = chunks
+        self.postings = postings
+        self.lengths = lengths
+        self.avgdl = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    @classmethod
+    def build(cls, chunks):
+        postings = {}
+        lengths = []
+        for doc_id, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_id, tf))
+        return cls(list(chunks), postings, lengths)
+
+    def idf(self, term):
+        df = len(self.postings.get(term, ()))
+        n = len(self.chunks)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def scores(self, query):
+        scores = {}
+        if not self.avgdl:
+            return scores
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in postings:
+                norm = K1 * (1 - B + B * self.lengths[doc_id] / self.avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, k=DEFAULT_TOP_K):
+        """Return the ids of the top-k chunks for ``query``, in document order."""
+        n = len(self.chunks)
+        if n <= k:
+            return list(range(n))
+
+        scores = self.scores(query)
+        if not scores:
+            # Nothing matched lexically (e.g. "summarize this"), so spread evenly over the document
+            step = n / k
+            return sorted({int(i * step) for i in range(k)})
+
+        ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))[:k]
+        return sorted(ranked)
+
+    @staticmethod
+    def search_many(indexes, query, k=DEFAULT_TOP_K):
+        """Top-k chunks across several indexes, as ``{position in indexes: chunk ids in document order}``."""
+        if len(indexes) == 1:
+            return {0: indexes[0].search(query, k)}
+
+        ranked = []
+        for i, index in enumerate(indexes):
+            ranked.extend((-score, i, doc_id) for doc_id, score in index.scores(query).items())
+        if not ranked:
+            # Nothing matched lexically anywhere; give every document an equal share
+            share = max(1, k // len(indexes))
+            return {i: index.search(query, share) for i, index in enumerate(indexes) if index.chunks}
+
+        hits = {}
+        for _, i, doc_id in sorted(ranked)[:k]:
+            hits.setdefault(i, []).append(doc_id)
+        return {i: sorted(ids) for i, ids in hits.items()}
+
+    def to_dict(self):
+        return {"chunks": self.chunks, "postings": self.postings, "lengths": self.lengths}
+
+    @classmethod
+    def from_dict(cls, data):
+        postings = {term: [tuple(p) for p in plist] for term, plist in data["postings"].items()}
+        return cls(data["chunks"], postings, data["lengths"])
+
+
+# ---------------------- INDEX STORE ----------------------
+MAX_LOADED = 32
+
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+
+
+def get_top_k():
+    return getattr(settings, "RETRIEVAL_TOP_K", DEFAULT_TOP_K)
+
+
+def _index_dir():
+    return os.path.join(settings.MEDIA_ROOT, "indexes")
+
+
+def _index_path(key):
+    return os.path.join(_index_dir(), f"{key}.json")
+
+
+def _remember(key, index):
+    with _loaded_lock:
+        _loaded[key] = index
+        _loaded.move_to_end(key)
+        while len(_loaded) > MAX_LOADED:
+            _loaded.popitem(last=False)
+
+
+def index_chunks(chunks):
+    """Build (or reuse) the BM25 index for ``chunks`` and return its key."""
+    key = hashlib.sha256("\x1e".join(chunks).encode("utf-8")).hexdigest()
+    if load_index(key) is not None:
+        return key
+
+    index = BM25Index.build(chunks)
+    os.makedirs(_index_dir(), exist_ok=True)
+    tmp_path = _index_path(key) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index.to_dict(), f, ensure_ascii=False)
+    os.replace(tmp_path, _index_path(key))
+    _remember(key, index)
+    print(f"📚 Indexed {len(chunks)} chunks ({len(index.postings)} terms)")
+    return key
+
+
+def load_index(key):
+    if not key:
+        return None
+    with _loaded_lock:
+        if key in _loaded:
+            _loaded.move_to_end(key)
+            return _loaded[key]
+
+    path = _index_path(key)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        index = BM25Index.from_dict(json.load(f))
+    _remember(key, index)
+    return index
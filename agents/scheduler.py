@@ -0,0 +1,267 @@
+import contextvars
+import hashlib
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+
+from .chunking import count_tokens
+from .llm_cache import make_key
+from .tracing import inc, record
+
+
+DEFAULTS = {
+    "LIMITS": {},  # per model: {"rpm": ..., "tpm": ...}; models not listed are not throttled
+    "COMPLETION_TOKENS": 512,  # reserved per call until the reply's real size is known
+    "MAX_RETRIES": 5,
+    "BACKOFF": 1.0,  # seconds; doubled per retry, with full jitter
+    "MAX_BACKOFF": 60,
+}
+RETRY_STATUSES = frozenset([408, 409, 429, 500, 502, 503, 504])
+RETRY_ERRORS = frozenset(["ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout",
+                          "APIConnectionError", "APITimeoutError"])
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+_slots = contextvars.ContextVar("llm_slots", default=None)
+_lock = threading.Lock()
+_limiters = {}
+_inflight = {}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "LLM_SCHEDULER", {})}
+
+
+@contextmanager
+def priority(level):
+    """Run LLM calls in this context (and threads started with its context) at ``level``."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextmanager
+def concurrency_slots(semaphore):
+    """Hold a slot of ``semaphore`` for each request made in this context, but not while backing off."""
+    token = _slots.set(semaphore)
+    try:
+        yield
+    finally:
+        _slots.reset(token)
+
+
+# ---------------------- TOKEN BUCKETS ----------------------
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        # A request larger than the whole bucket waits for a full bucket rather than forever
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0) / self.rate
+
+    def take(self, amount):
+        self.level = min(self.capacity, self.level - amount)
+
+
+class Limiter:
+    """Requests- and tokens-per-minute budgets for one provider and API key.
+
+    Callers queue by priority, then arrival; only the head of the queue may
+    take from the buckets, so background work never jumps an interactive call.
+    A 429 pauses everyone queued on the key instead of letting each retry on its own.
+    """
+
+    def __init__(self, rpm=None, tpm=None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+
+    def acquire(self, tokens, level):
+        entry = (level, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._queue[0] == entry:
+                        wait = max(
+                            self.paused_until - now,
+                            self.requests.wait_time(1, now) if self.requests else 0,
+                            self.tokens.wait_time(tokens, now) if self.tokens else 0,
+                        )
+                        if wait <= 0:
+                            if self.requests:
+                                self.requests.take(1)
+                            if self.tokens:
+                                self.tokens.take(tokens)
+                            return
+                    self._cond.wait(wait)
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def settle(self, reserved, used):
+        # Hand back (or charge) the difference between the estimate and the real size
+        if self.tokens:
+            with self._cond:
+                self.tokens.take(used - reserved)
+
+    def pause(self, seconds):
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+def get_limiter(model, api_key):
+    key = (model, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest())
+    with _lock:
+        if key not in _limiters:
+            limits = _config()["LIMITS"].get(model, {})
+            _limiters[key] = Limiter(limits.get("rpm"), limits.get("tpm"))
+        return _limiters[key]
+
+
+# ---------------------- RETRIES ----------------------
+def _status(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) or getattr(error, "status_code", None)
+
+
+def _retry_after(error):
+    """Seconds from a Retry-After header (delta-seconds or HTTP-date), if the provider sent one."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _retryable(error):
+    status = _status(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return type(error).__name__ in RETRY_ERRORS
+
+
+def _backoff(error, attempt, config):
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        return retry_after + random.uniform(0, config["BACKOFF"])
+    return random.uniform(0, min(config["MAX_BACKOFF"], config["BACKOFF"] * 2 ** attempt))
+
+
+# ---------------------- SCHEDULED LLM ----------------------
+class ScheduledLLM:
+    """Wraps a provider client so every call waits for its rate budget and retries transient errors.
+
+    Identical ``invoke`` calls that overlap share one request (single flight).
+    """
+
+    def __init__(self, llm, model, api_key, system_prompt=None):
+        self.llm = llm
+        self.model = model
+        self.api_key = api_key
+        self.system_prompt = system_prompt
+
+    def _call(self, messages, call):
+        config = _config()
+        limiter = get_limiter(self.model, self.api_key)
+        level = _priority.get()
+        slots = _slots.get() or nullcontext()
+        prompt_tokens = count_tokens("".join(msg.content for msg in messages))
+        reserved = prompt_tokens + config["COMPLETION_TOKENS"]
+
+        for attempt in itertools.count():
+            started = time.perf_counter()
+            limiter.acquire(reserved, level)
+            record("llm_queue", time.perf_counter() - started,
+                   {"model": self.model, "priority": "background" if level else "interactive"})
+            try:
+                with slots:
+                    result = call()
+            except Exception as e:
+                if attempt >= config["MAX_RETRIES"] or not _retryable(e):
+                    raise
+                delay = _backoff(e, attempt, config)
+                status = _status(e)
+                inc("llm_retries_total", model=self.model, reason=status or type(e).__name__)
+                if status == 429:
+                    limiter.pause(delay)
+                print(f"⏳ {self.model} call failed ({status or type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            # Returns the result and a callback that charges the reply's real size
+            return result, lambda content: limiter.settle(reserved, prompt_tokens + count_tokens(content))
+
+    def invoke(self, messages):
+        key = make_key(self.model, self.system_prompt, messages, self.api_key)
+        with _lock:
+            flight = _inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _inflight[key] = {"done": threading.Event(), "result": None, "error": None}
+
+        if not leader:
+            inc("llm_coalesced_total", model=self.model)
+            flight["done"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["result"]
+
+        try:
+            response, settle = self._call(messages, lambda: self.llm.invoke(messages))
+            settle(response.content)
+            flight["result"] = response
+            return response
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with _lock:
+                _inflight.pop(key, None)
+            flight["done"].set()
+
+    def stream(self, messages):
+        # Retried only until the first chunk arrives; after that a failure reaches the reader
+        def first():
+            chunks = iter(self.llm.stream(messages))
+            return chunks, next(chunks, None)
+
+        (chunks, chunk), settle = self._call(messages, first)
+        parts = []
+        while chunk is not None:
+            parts.append(chunk.content or "")
+            yield chunk
+            chunk = next(chunks, None)
+        settle("".join(parts))
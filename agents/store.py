@@ -0,0 +1,229 @@
+import hashlib
+import os
+
+from django.db import transaction
+
+from .models import Chunk, ConversationMemory, ConversationTurn, Corpus, CorpusDocument, Document, IngestionJob, Summary
+
+
+def get_session_key(request):
+    if not request.session.session_key:
+        request.session.save()
+    return request.session.session_key
+
+
+# ---------------------- DOCUMENTS ----------------------
+def chunk_summary(document, position, text):
+    return Summary(
+        document=document, level=0, position=position,
+        chunk_start=position, chunk_end=position + 1, text=text,
+    )
+
+
+def summaries_digest(summaries):
+    """Hash of ``(level, position, text)`` rows; by content, so identical pages match across sessions."""
+    if not summaries:
+        return ""
+    digest = hashlib.sha256()
+    for level, position, text in sorted(summaries):
+        digest.update(f"{level}:{position}:{text}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def update_summaries_digest(document):
+    document.summaries_digest = summaries_digest(list(document.summaries.values_list("level", "position", "text")))
+    Document.objects.filter(pk=document.pk).update(summaries_digest=document.summaries_digest)
+
+
+@transaction.atomic
+def save_document(session_key, kind, name, chunks, summaries=None, path="", index_key="", replace=True, **fields):
+    # Re-ingesting the same URL replaces the previous copy; shared files are never replaced
+    if replace:
+        Document.objects.filter(session_key=session_key, kind=kind, name=name).delete()
+    document = Document.objects.create(
+        session_key=session_key, kind=kind, name=name, path=path, index_key=index_key,
+        summaries_digest=summaries_digest([(0, i, text) for i, text in enumerate(summaries or [])]), **fields,
+    )
+    Chunk.objects.bulk_create([
+        Chunk(document=document, position=i, text=text) for i, text in enumerate(chunks)
+    ])
+    if summaries:
+        Summary.objects.bulk_create([
+            chunk_summary(document, i, text) for i, text in enumerate(summaries)
+        ])
+    return document
+
+
+@transaction.atomic
+def replace_chunks(document, chunks, index_key, **fields):
+    """Swap in new chunk texts, keeping the summaries of chunks whose text did not change.
+
+    Returns how many chunk summaries were reused.
+    """
+    previous = dict(document.summaries.filter(level=0).values_list("position", "text"))
+    reusable = {}
+    for position, text in document.chunks.values_list("position", "text"):
+        if position in previous:
+            reusable[text] = previous[position]
+
+    document.chunks.all().delete()
+    document.summaries.all().delete()  # higher levels are stale as soon as any chunk changes
+    Chunk.objects.bulk_create([
+        Chunk(document=document, position=i, text=text) for i, text in enumerate(chunks)
+    ])
+    kept = [
+        chunk_summary(document, i, reusable[text])
+        for i, text in enumerate(chunks) if text in reusable
+    ]
+    Summary.objects.bulk_create(kept)
+
+    document.summaries_digest = summaries_digest([(0, summary.position, summary.text) for summary in kept])
+    document.index_key = index_key
+    for name, value in fields.items():
+        setattr(document, name, value)
+    document.save()
+    return len(kept)
+
+
+def get_url_documents(request):
+    ids = request.session.get("url_documents", {})
+    documents = Document.objects.in_bulk(list(ids.values()))
+    return {url: documents[pk] for url, pk in ids.items() if pk in documents}
+
+
+def get_chunks(document):
+    return list(document.chunks.values_list("text", flat=True))
+
+
+def get_summaries(document, positions=None, level=0):
+    summaries = document.summaries.filter(level=level)
+    if positions is not None:
+        summaries = summaries.filter(position__in=positions)
+    return list(summaries.order_by("position").values_list("text", flat=True))
+
+
+def find_shared_file(content_hash, chunk_tokens, model_name, rules):
+    """A fully ingested copy of this file content, if any session has one.
+
+    Its summaries come from the job that ingested it, so only a copy chunked
+    for the same budget and summarized by the same model under the same rules
+    is shared.
+    """
+    return (
+        Document.objects.filter(
+            kind=Document.FILE, content_hash=content_hash, chunk_tokens=chunk_tokens,
+            ingestionjob__status=IngestionJob.DONE, ingestionjob__model_name=model_name or "",
+            ingestionjob__rules=list(rules or []),
+        )
+        .order_by("-pk")
+        .first()
+    )
+
+
+def delete_documents(session_key, kind=None, name=None):
+    documents = Document.objects.filter(session_key=session_key)
+    if kind:
+        documents = documents.filter(kind=kind)
+    if name:
+        documents = documents.filter(name=name)
+    documents.delete()
+
+
+# ---------------------- CORPUS ----------------------
+def get_corpus(request):
+    corpus, _ = Corpus.objects.get_or_create(key=get_session_key(request))
+    # Sessions from before corpora had a single active file
+    legacy_id = request.session.pop("file_document_id", None)
+    if legacy_id:
+        document = Document.objects.filter(pk=legacy_id).first()
+        if document is not None:
+            CorpusDocument.objects.get_or_create(corpus=corpus, name=document.name, defaults={"document": document})
+    return corpus
+
+
+def add_to_corpus(request, document, name):
+    """Link ``document`` into the session's corpus as ``name``, replacing whatever had that name."""
+    corpus = get_corpus(request)
+    previous = CorpusDocument.objects.filter(corpus=corpus, name=name).select_related("document").first()
+    CorpusDocument.objects.update_or_create(corpus=corpus, name=name, defaults={"document": document})
+    if previous is not None and previous.document_id != document.pk:
+        release_file(previous.document)
+
+
+def get_corpus_files(request):
+    if not request.session.session_key:
+        return []
+    if request.session.get("file_document_id"):
+        get_corpus(request)
+    return list(
+        CorpusDocument.objects.filter(corpus__key=request.session.session_key).select_related("document")
+    )
+
+
+def get_target_files(request, document_ids=None):
+    """The corpus documents a question should read: those with the given int ids, or all of them."""
+    entries = get_corpus_files(request)
+    if document_ids:
+        wanted = set(document_ids)
+        entries = [entry for entry in entries if entry.document_id in wanted]
+    return [entry.document for entry in entries]
+
+
+def remove_from_corpus(request, name):
+    if not request.session.session_key:
+        return False
+    entry = CorpusDocument.objects.filter(corpus__key=request.session.session_key, name=name).first()
+    if entry is None:
+        return False
+    entry.delete()
+    release_file(entry.document)
+    return True
+
+
+def release_file(document):
+    """Delete a shared file document, and its stored upload, once no corpus links to it."""
+    if document.corpus_entries.exists():
+        return
+    path = document.path
+    document.delete()
+    if not path or Document.objects.filter(path=path).exists():
+        return
+    # Uploads are content-addressed, so another session may still be ingesting this same file
+    if IngestionJob.objects.filter(path=path, status__in=[IngestionJob.PENDING, IngestionJob.RUNNING]).exists():
+        return
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# ---------------------- CONVERSATION ----------------------
+def add_turn(request, question, result):
+    return ConversationTurn.objects.create(
+        session_key=get_session_key(request),
+        question=question,
+        retrieved_data=result.get("retrieved_data") or "",
+        summarized_data=result.get("summarized_data") or "",
+        final_answer=result.get("final_answer") or "",
+    )
+
+
+def get_turn_page(request, before=None, size=10):
+    """The ``size`` latest turns older than turn id ``before``, oldest first, and whether more remain."""
+    if not request.session.session_key:
+        return [], False
+    turns = ConversationTurn.objects.filter(session_key=request.session.session_key)
+    if before:
+        turns = turns.filter(pk__lt=before)
+    page = list(turns.order_by("-pk")[:size + 1])
+    return page[:size][::-1], len(page) > size
+
+
+def clear_session_data(session_key):
+    Document.objects.filter(session_key=session_key).delete()
+    corpus = Corpus.objects.filter(key=session_key).first()
+    if corpus is not None:
+        documents = [entry.document for entry in corpus.entries.select_related("document")]
+        corpus.delete()
+        for document in documents:
+            release_file(document)
+    ConversationTurn.objects.filter(session_key=session_key).delete()
+    ConversationMemory.objects.filter(session_key=session_key).delete()
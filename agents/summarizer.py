@@ -0,0 +1,77 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from langchain_core.messages import HumanMessage
+
+from .scheduler import concurrency_slots
+
+
+DEFAULT_CONCURRENCY = 4
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+class ChunkSummaryError(RuntimeError):
+    def __init__(self, failed, errors):
+        self.failed = failed
+        self.errors = errors
+        first = errors[failed[0]]
+        super().__init__(f"{len(failed)} chunk(s) failed to summarize: {first}")
+
+
+# ---------------------- CONCURRENCY LIMITS ----------------------
+def get_concurrency(provider):
+    limits = getattr(settings, "LLM_CONCURRENCY", {})
+    return max(1, int(limits.get(provider, DEFAULT_CONCURRENCY)))
+
+
+def _provider_semaphore(provider):
+    # Shared across requests so concurrent uploads don't multiply the provider limit
+    with _semaphores_lock:
+        if provider not in _semaphores:
+            _semaphores[provider] = threading.BoundedSemaphore(get_concurrency(provider))
+        return _semaphores[provider]
+
+
+# ---------------------- SUMMARIZATION ENGINE ----------------------
+def summarize_chunks(llm, chunks, prompt, provider=None, on_result=None):
+    """Run ``prompt(chunk)`` through ``llm`` for every chunk concurrently.
+
+    Results come back in chunk order. Transient provider errors are retried by
+    the scheduler inside ``llm``; if any chunk still fails, ChunkSummaryError is
+    raised. ``on_result(index, text)`` is called in the caller's thread as each chunk finishes.
+    """
+    if not chunks:
+        return []
+
+    semaphore = _provider_semaphore(provider)
+    workers = min(get_concurrency(provider), len(chunks))
+
+    def run(index):
+        # The scheduler holds a slot only while a request is in flight, not while it backs off
+        with concurrency_slots(semaphore):
+            return llm.invoke([HumanMessage(content=prompt(chunks[index]))]).content
+
+    results = [None] * len(chunks)
+    errors = {}
+
+    print(f"🔍 Summarizing {len(chunks)} chunks ({workers} workers)")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Each call runs in a copy of the caller's context so its spans land in the caller's trace
+        futures = {pool.submit(contextvars.copy_context().run, run, i): i for i in range(len(chunks))}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+                if on_result:
+                    on_result(i, results[i])
+            except Exception as e:
+                print(f"⚠️ Chunk {i+1}/{len(chunks)} failed: {e}")
+                errors[i] = e
+
+    if errors:
+        raise ChunkSummaryError(sorted(errors), errors)
+    return results
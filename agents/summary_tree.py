@@ -0,0 +1,119 @@
+from django.db.models import Q
+
+from .chunking import count_tokens
+from .models import Summary
+from .summarizer import summarize_chunks
+
+
+COMBINE_PROMPT = "Combine these summaries of consecutive parts of a document into one summary:\n\n{chunk}"
+SEPARATOR = "\n---\n"
+
+
+# ---------------------- BUILDING ----------------------
+def _group(nodes, max_tokens):
+    """Pack consecutive nodes into groups that fit ``max_tokens``, at least two per group."""
+    groups = []
+    current = []
+    size = 0
+    for node in nodes:
+        tokens = count_tokens(node.text)
+        if len(current) >= 2 and size + tokens > max_tokens:
+            groups.append(current)
+            current, size = [], 0
+        current.append(node)
+        size += tokens
+
+    # A lone trailing node would not shrink the level; fold it into the previous group
+    if len(current) == 1 and groups:
+        groups[-1].extend(current)
+    elif current:
+        groups.append(current)
+    return groups
+
+
+def build_summary_tree(document, llm, provider=None):
+    """Summarize level-0 summaries upwards until a single document summary remains.
+
+    Nodes already stored with the same chunk span are reused, so an interrupted
+    build picks up where it stopped. Returns the top level.
+    """
+    max_tokens = llm.budget["chunk_tokens"]
+    level = 0
+    nodes = list(document.summaries.filter(level=0).order_by("position"))
+
+    while len(nodes) > 1:
+        groups = _group(nodes, max_tokens)
+        existing = {node.position: node for node in document.summaries.filter(level=level + 1)}
+
+        parents = []
+        missing = []
+        for position, group in enumerate(groups):
+            node = existing.get(position)
+            if node is None or (node.chunk_start, node.chunk_end) != (group[0].chunk_start, group[-1].chunk_end):
+                missing.append(position)
+            parents.append(node)
+
+        if missing:
+            print(f"🌳 Summarizing level {level + 1}: {len(missing)} of {len(groups)} nodes")
+            texts = summarize_chunks(
+                llm, [SEPARATOR.join(node.text for node in groups[position]) for position in missing],
+                lambda chunk: COMBINE_PROMPT.replace("{chunk}", chunk),
+                provider=provider,
+            )
+            for position, text in zip(missing, texts):
+                parents[position], _ = Summary.objects.update_or_create(
+                    document=document, level=level + 1, position=position,
+                    defaults={
+                        "text": text,
+                        "chunk_start": groups[position][0].chunk_start,
+                        "chunk_end": groups[position][-1].chunk_end,
+                    },
+                )
+
+        document.summaries.filter(level=level + 1, position__gte=len(groups)).delete()
+        nodes = parents
+        level += 1
+
+    document.summaries.filter(level__gt=level).delete()
+    return level
+
+
+# ---------------------- QUERYING ----------------------
+def _covering(document, level, positions):
+    spans = Q()
+    for position in positions:
+        spans |= Q(chunk_start__lte=position, chunk_end__gt=position)
+    return list(
+        document.summaries.filter(spans, level=level).order_by("position").values_list("text", flat=True)
+    )
+
+
+def summary_context(document, positions, max_tokens):
+    """Summaries covering the chunks at ``positions`` from the lowest tree level that fits ``max_tokens``.
+
+    Walks at most one query per level, so the cost grows with the tree height
+    rather than the document length. Returns "" when the tree is not built yet.
+    """
+    positions = sorted(set(positions))
+    levels = list(document.summaries.values_list("level", flat=True).distinct().order_by("level"))
+    if not positions or not levels:
+        return ""
+
+    top = levels[-1]
+    for level in levels:
+        texts = _covering(document, level, positions)
+        if not texts:
+            continue
+        context = SEPARATOR.join(texts)
+        tokens = count_tokens(context)
+        if tokens > max_tokens and level != top:
+            continue
+
+        # Below the root, add the whole-document summary as an overview when it still fits
+        if level != top:
+            overview = SEPARATOR.join(document.summaries.filter(level=top).values_list("text", flat=True))
+            if overview and tokens + count_tokens(overview) <= max_tokens:
+                context = f"Document overview:\n{overview}\n\nRelevant sections:\n{context}"
+        print(f"🌳 Using summary level {level} of {top} for {len(positions)} chunks")
+        return context
+    return ""
@@ -1,3 +1,938 @@
-from django.test import TestCase
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from langchain_core.messages import AIMessage, HumanMessage
+
+from . import answer_cache, benchmark, extraction, jobs, retrieval, utils
+from .batch import answer_batch
+from .benchmark import make_pages, stub_server
+from .chunking import chunk_text, count_tokens, get_model_budget
+from .context_packer import pack_context, split_sources
+from .extraction import ExtractionError, _pdf_pages, iter_pdf_pages
+from .fetcher import fetch_many
+from .llm_cache import CachedLLM, LLMCache, make_key
+from .memory import get_memory, update_memory
+from .models import ConversationMemory, ConversationTurn, Document, IngestionJob, Summary
+from .retrieval import BM25Index, index_chunks, load_index, tokenize
+from .scheduler import BACKGROUND, INTERACTIVE, Limiter, ScheduledLLM, get_limiter
+from .store import (
+    add_to_corpus,
+    find_shared_file,
+    release_file,
+    replace_chunks,
+    save_document,
+    summaries_digest,
+    update_summaries_digest,
+)
+from .summarizer import ChunkSummaryError, summarize_chunks
+from .summary_tree import build_summary_tree, summary_context
+from .transport import get_async_http_client, get_http_client, get_session, host_metrics
+from .webpage import MainTextParser, extract_main_text
+
+
+class EchoLLM:
+    """Answers each prompt with itself, after ``delay`` seconds; records the peak number of concurrent calls."""
+
+    def __init__(self, delay=0.0, fail=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.active = self.peak = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, messages):
+        prompt = messages[-1].content
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            if prompt in self.fail:
+                raise RuntimeError(f"cannot summarize {prompt}")
+            return AIMessage(content=prompt.upper())
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class SummarizeChunksTests(SimpleTestCase):
+    def test_results_come_back_in_chunk_order(self):
+        chunks = [f"chunk {i}" for i in range(10)]
+        results = summarize_chunks(EchoLLM(), chunks, lambda chunk: chunk, provider="order-test")
+        self.assertEqual(results, [chunk.upper() for chunk in chunks])
+
+    @override_settings(LLM_CONCURRENCY={"capped-test": 2})
+    def test_concurrency_is_capped_per_provider(self):
+        llm = EchoLLM(delay=0.05)
+        summarize_chunks(llm, [f"chunk {i}" for i in range(8)], lambda chunk: chunk, provider="capped-test")
+        self.assertEqual(llm.peak, 2)
+
+    def test_failed_chunks_raise_with_their_positions(self):
+        llm = EchoLLM(fail={"b", "d"})
+        with self.assertRaises(ChunkSummaryError) as raised:
+            summarize_chunks(llm, ["a", "b", "c", "d"], lambda chunk: chunk, provider="failing-test")
+        self.assertEqual(sorted(raised.exception.failed), [1, 3])
+
+    def test_no_chunks_make_no_calls(self):
+        self.assertEqual(summarize_chunks(EchoLLM(fail={""}), [], lambda chunk: chunk), [])
+
+
+class LLMCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def cache(self, ttl=60, max_entries=100, max_bytes=10_000):
+        return LLMCache(self.path, ttl, max_entries, max_bytes)
+
+    def test_entries_expire_after_ttl(self):
+        cache = self.cache(ttl=60)
+        with mock.patch("agents.llm_cache.time.time", return_value=1000.0):
+            cache.set("k", "gpt4", "answer")
+        with mock.patch("agents.llm_cache.time.time", return_value=1059.0):
+            self.assertEqual(cache.get("k"), "answer")
+        with mock.patch("agents.llm_cache.time.time", return_value=1061.0):
+            self.assertIsNone(cache.get("k"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_least_recently_used_entry_is_evicted_first(self):
+        cache = self.cache(max_entries=2)
+        clock = mock.Mock(return_value=1000.0)
+        with mock.patch("agents.llm_cache.time.time", clock):
+            cache.set("a", "gpt4", "A")
+            clock.return_value += 1
+            cache.set("b", "gpt4", "B")
+            clock.return_value += 1
+            cache.get("a")  # now "b" is the least recently used
+            clock.return_value += 1
+            cache.set("c", "gpt4", "C")
+            self.assertEqual([cache.get(key) for key in "abc"], ["A", None, "C"])
+
+    def test_byte_cap_evicts_until_under_it(self):
+        cache = self.cache(max_bytes=10)
+        cache.set("a", "gpt4", "x" * 6)
+        cache.set("b", "gpt4", "y" * 6)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["bytes"], 6)
+
+    def test_keys_differ_by_model_system_prompt_and_scope(self):
+        messages = [HumanMessage(content="hi")]
+        keys = {
+            make_key("gpt4", None, messages),
+            make_key("mistral", None, messages),
+            make_key("gpt4", "Be brief.", messages),
+            make_key("gpt4", None, messages, scope="other-key"),
+        }
+        self.assertEqual(len(keys), 4)
+
+    def test_cached_llm_answers_repeats_from_the_cache(self):
+        llm = mock.Mock()
+        llm.invoke.return_value = AIMessage(content="fresh")
+        cached = CachedLLM(llm, "gpt4")
+        with mock.patch("agents.llm_cache.get_cache", return_value=self.cache()):
+            first = cached.invoke([HumanMessage(content="q")])
+            second = cached.invoke([HumanMessage(content="q")])
+        self.assertEqual((first.content, second.content), ("fresh", "fresh"))
+        self.assertEqual(llm.invoke.call_count, 1)
+
+
+class BM25Tests(SimpleTestCase):
+    CHUNKS = [
+        "The cafeteria menu changes every week.",
+        "Latency is the delay before a transfer of data begins.",
+        "Throughput and latency are both network measures; latency is measured in milliseconds.",
+        "Parking is free for visitors on weekends.",
+        "The annual report covers revenue and costs.",
+    ]
+
+    def test_tokenize_drops_stopwords_and_single_letters(self):
+        self.assertEqual(tokenize("What is the Latency of a TCP link?"), ["latency", "tcp", "link"])
+
+    def test_chunks_matching_more_often_rank_higher(self):
+        index = BM25Index.build(self.CHUNKS)
+        scores = index.scores("latency")
+        self.assertEqual(set(scores), {1, 2})
+        self.assertGreater(scores[2], scores[1])
+
+    def test_rare_terms_outweigh_common_ones(self):
+        chunks = ["report report report"] * 4 + ["report revenue"]
+        index = BM25Index.build(chunks)
+        self.assertEqual(index.search("report revenue", k=1), [4])
+
+    def test_search_returns_top_k_in_document_order(self):
+        index = BM25Index.build(self.CHUNKS)
+        self.assertEqual(index.search("latency parking", k=3), [1, 2, 3])
+
+    def test_no_match_spreads_over_the_document(self):
+        index = BM25Index.build(self.CHUNKS * 2)
+        self.assertEqual(index.search("summarize this", k=2), [0, 5])
+
+    def test_small_documents_return_every_chunk(self):
+        self.assertEqual(BM25Index.build(self.CHUNKS[:2]).search("parking", k=4), [0, 1])
+
+    def test_search_many_ranks_chunks_across_documents(self):
+        indexes = [BM25Index.build(self.CHUNKS), BM25Index.build(["Latency budgets for the API.", "Lunch is at noon."])]
+        self.assertEqual(BM25Index.search_many(indexes, "latency milliseconds", k=2), {0: [1, 2]})
+        self.assertEqual(BM25Index.search_many(indexes, "latency", k=3), {0: [1, 2], 1: [0]})
+
+    def test_search_many_shares_k_when_nothing_matches(self):
+        indexes = [BM25Index.build(self.CHUNKS), BM25Index.build(self.CHUNKS)]
+        self.assertEqual(BM25Index.search_many(indexes, "summarize this", k=4), {0: [0, 2], 1: [0, 2]})
+
+    def test_index_is_stored_and_reloaded_by_key(self):
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            key = index_chunks(self.CHUNKS)
+            self.assertEqual(index_chunks(self.CHUNKS), key)
+            retrieval._loaded.clear()
+            index = load_index(key)
+        self.assertEqual(index.chunks, self.CHUNKS)
+        self.assertEqual(index.search("latency", k=2), [1, 2])
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class TransportTests(SimpleTestCase):
+    def test_openai_compatible_models_use_the_pooled_sync_and_async_clients(self):
+        for model in ("llama3", "gpt4"):
+            chat = utils._build_llm(model, "test-key", None, None).llm.llm.last
+            self.assertIs(chat.client._client._client, get_http_client())
+            self.assertIs(chat.async_client._client._client, get_async_http_client())
+
+    def test_requests_and_httpx_traffic_are_counted_per_host(self):
+        with local_server() as host:
+            get_session().get(f"http://{host}/a")
+            get_http_client().get(f"http://{host}/b")
+            stats = host_metrics()[host]
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["status"], {200: 2})
+        self.assertEqual(stats["connections_opened"], 1)
+
+
+def sentences(start, count):
+    return " ".join(f"Sentence {i} describes part {i} of the system in plain words." for i in range(start, start + count))
+
+
+class ChunkTextTests(SimpleTestCase):
+    def test_chunks_fit_the_budget(self):
+        text = "\n\n".join(sentences(i * 10, 10) for i in range(10))
+        chunks = list(chunk_text(text, 100))
+        self.assertGreater(len(chunks), 5)
+        self.assertTrue(all(count_tokens(chunk) <= 100 for chunk in chunks))
+
+    def test_breaks_fall_on_sentence_boundaries(self):
+        chunks = list(chunk_text(sentences(0, 40), 60))
+        self.assertTrue(all(chunk.endswith(".") for chunk in chunks))
+
+    def test_next_chunk_repeats_the_previous_ones_tail(self):
+        first, second = list(chunk_text(sentences(0, 12), 100, overlap_tokens=20))[:2]
+        last_sentence = first.rsplit(". ", 1)[-1]
+        self.assertTrue(second.startswith(last_sentence))
+
+    def test_heading_starts_a_chunk_without_overlap_once_half_full(self):
+        text = sentences(0, 6) + "\n\n## Deployment\n\n" + sentences(100, 2)
+        chunks = list(chunk_text(text, 120, overlap_tokens=20))
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(chunks[1].startswith("## Deployment"))
+
+    def test_sentence_longer_than_the_budget_is_cut(self):
+        chunks = list(chunk_text("word " * 400, 50))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(count_tokens(chunk) <= 50 for chunk in chunks))
+
+    def test_sections_split_mid_paragraph_chunk_like_the_whole_text(self):
+        text = "\n\n".join(sentences(i * 10, 10) for i in range(30))
+        sections = [text[i:i + 333] for i in range(0, len(text), 333)]
+        self.assertEqual(list(chunk_text(sections, 80, 10)), list(chunk_text(text, 80, 10)))
+
+    @override_settings(LLM_MODELS={"small": {"chunk_tokens": 500}})
+    def test_model_budget_falls_back_to_defaults(self):
+        self.assertEqual(get_model_budget("small"), {"context_tokens": 8192, "chunk_tokens": 500})
+        self.assertEqual(get_model_budget("unknown"), {"context_tokens": 8192, "chunk_tokens": 6000})
+
+
+class RangeLLM:
+    """Summarizes any text as the range of part numbers it mentions, e.g. "Parts 0-3."."""
+
+    budget = {"chunk_tokens": 20}
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        numbers = [int(n) for n in re.findall(r"\d+", messages[-1].content)]
+        return AIMessage(content=f"Parts {min(numbers)}-{max(numbers)}.")
+
+
+class SummaryTreeTests(TestCase):
+    def setUp(self):
+        self.document = Document.objects.create(session_key="s", kind=Document.FILE, name="a.txt")
+        Summary.objects.bulk_create(
+            Summary(document=self.document, level=0, position=i, chunk_start=i, chunk_end=i + 1,
+                    text=f"Part {i} in short.")
+            for i in range(8)
+        )
+
+    def test_levels_shrink_to_a_single_root_covering_every_chunk(self):
+        top = build_summary_tree(self.document, RangeLLM(), provider="tree-test")
+        root = Summary.objects.get(document=self.document, level=top)
+        self.assertGreater(top, 1)
+        self.assertEqual((root.chunk_start, root.chunk_end, root.text), (0, 8, "Parts 0-7."))
+        for level in range(1, top):
+            nodes = list(Summary.objects.filter(document=self.document, level=level))
+            self.assertEqual(nodes[0].chunk_start, 0)
+            self.assertEqual(nodes[-1].chunk_end, 8)
+            self.assertTrue(all(a.chunk_end == b.chunk_start for a, b in zip(nodes, nodes[1:])))
+
+    def test_rebuild_reuses_stored_nodes(self):
+        build_summary_tree(self.document, RangeLLM(), provider="tree-test")
+        llm = RangeLLM()
+        build_summary_tree(self.document, llm, provider="tree-test")
+        self.assertEqual(llm.calls, 0)
+
+    def test_context_comes_from_the_lowest_level_that_fits(self):
+        build_summary_tree(self.document, RangeLLM(), provider="tree-test")
+        self.assertEqual(summary_context(self.document, [2], 1000).split("Relevant sections:\n")[-1],
+                         "Part 2 in short.")
+        # Three leaves do not fit in 12 tokens, the level above does
+        context = summary_context(self.document, [0, 1, 2], 12)
+        self.assertNotIn("Part 0 in short.", context)
+        self.assertIn("Parts 0-", context)
+
+    def test_overview_is_added_when_it_fits(self):
+        build_summary_tree(self.document, RangeLLM(), provider="tree-test")
+        context = summary_context(self.document, [5], 1000)
+        self.assertTrue(context.startswith("Document overview:\nParts 0-7."))
+
+    def test_no_tree_means_no_context(self):
+        Summary.objects.all().delete()
+        self.assertEqual(summary_context(self.document, [0], 1000), "")
+
+
+@override_settings(CONVERSATION={"RECENT_TURNS": 2, "MAX_TURNS": 200})
+class ConversationMemoryTests(TestCase):
+    def setUp(self):
+        self.request = SimpleNamespace(session=SimpleNamespace(session_key="chat"))
+        self.llm = mock.Mock()
+        self.llm.invoke.return_value = AIMessage(content="They asked about turns 0 to 3.")
+
+    def add_turns(self, count):
+        start = ConversationTurn.objects.count()
+        for i in range(start, start + count):
+            ConversationTurn.objects.create(session_key="chat", question=f"Question {i}?", final_answer=f"Answer {i}.")
+
+    def test_recent_turns_are_not_folded(self):
+        self.add_turns(3)
+        update_memory(self.request, self.llm)
+        self.llm.invoke.assert_not_called()
+        self.assertIn("Question 0?", get_memory(self.request))
+
+    def test_older_turns_fold_into_the_summary_in_one_call(self):
+        self.add_turns(6)
+        update_memory(self.request, self.llm)
+        self.assertEqual(self.llm.invoke.call_count, 1)
+        self.assertIn("Question 3?", self.llm.invoke.call_args[0][0][0].content)
+
+        memory = get_memory(self.request)
+        self.assertTrue(memory.startswith("Earlier in the conversation:\nThey asked about turns 0 to 3."))
+        self.assertNotIn("Question 3?", memory)
+        self.assertIn("Question 4?", memory)
+        self.assertIn("Question 5?", memory)
+
+    @override_settings(CONVERSATION={"RECENT_TURNS": 2, "MAX_TURNS": 3})
+    def test_history_is_capped_to_max_turns(self):
+        self.add_turns(8)
+        update_memory(self.request, self.llm)
+        questions = list(ConversationTurn.objects.values_list("question", flat=True))
+        self.assertEqual(questions, ["Question 5?", "Question 6?", "Question 7?"])
+
+    @override_settings(CONVERSATION={"RECENT_TURNS": 2, "MAX_TURNS": 1})
+    def test_turns_not_in_the_summary_are_kept_past_the_cap(self):
+        self.add_turns(6)
+        update_memory(self.request, self.llm)
+        last_folded = ConversationMemory.objects.get(session_key="chat").last_turn_id
+        self.assertEqual(ConversationTurn.objects.filter(pk__gt=last_folded).count(), 2)
+        self.assertEqual(ConversationTurn.objects.count(), 2)
+
+
+
+class SlowFetch:
+    """Sleeps for the requested delay; records the peak number of concurrent fetches per host."""
+
+    def __init__(self):
+        self.active = {}
+        self.peak = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url, delay, timeout):
+        host = url.split("/")[2]
+        with self._lock:
+            self.active[host] = self.active.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+        try:
+            time.sleep(min(delay, timeout))
+            if delay > timeout:
+                raise TimeoutError(url)
+            return url
+        finally:
+            with self._lock:
+                self.active[host] -= 1
+
+
+class FetchManyTests(SimpleTestCase):
+    @override_settings(URL_FETCH={"PER_HOST": 2})
+    def test_each_host_is_capped(self):
+        fetch = SlowFetch()
+        requests = [(f"http://capped.test/{i}", (0.05,)) for i in range(6)]
+        requests += [(f"http://other.test/{i}", (0.05,)) for i in range(2)]
+        results = fetch_many(fetch, requests, deadline=5)
+        self.assertEqual([result for result, _ in results], [url for url, _ in requests])
+        self.assertEqual(fetch.peak, {"capped.test": 2, "other.test": 2})
+
+    def test_slow_urls_time_out_and_the_rest_are_returned(self):
+        requests = [("http://fast.test/a", (0,)), ("http://slow.test/b", (2,)), ("http://fast.test/c", (0,))]
+        started = time.monotonic()
+        results = fetch_many(SlowFetch(), requests, deadline=0.3)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual([results[0], results[2]], [("http://fast.test/a", None), ("http://fast.test/c", None)])
+        self.assertIsNone(results[1][0])
+        self.assertIsInstance(results[1][1], TimeoutError)
+
+    def test_fetch_errors_are_reported_per_url(self):
+        def fetch(url, timeout):
+            if url.endswith("bad"):
+                raise ValueError("bad page")
+            return url
+
+        results = fetch_many(fetch, [("http://errors.test/ok", ()), ("http://errors.test/bad", ())], deadline=5)
+        self.assertEqual(results[0], ("http://errors.test/ok", None))
+        self.assertIsInstance(results[1][1], ValueError)
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+class CountingLLM:
+    """Answers after ``delay`` seconds, first raising the given errors in order."""
+
+    def __init__(self, delay=0.0, errors=()):
+        self.delay = delay
+        self.errors = list(errors)
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        return AIMessage(content=f"answer {self.calls}")
+
+
+@override_settings(LLM_SCHEDULER={"BACKOFF": 0.01, "MAX_RETRIES": 2})
+class SchedulerTests(SimpleTestCase):
+    def test_interactive_calls_go_before_queued_background_ones(self):
+        limiter = Limiter()
+        limiter.pause(0.2)
+        order = []
+
+        def acquire(level):
+            limiter.acquire(1, level)
+            order.append(level)
+
+        background = threading.Thread(target=acquire, args=(BACKGROUND,))
+        background.start()
+        time.sleep(0.05)
+        interactive = threading.Thread(target=acquire, args=(INTERACTIVE,))
+        interactive.start()
+        background.join()
+        interactive.join()
+        self.assertEqual(order, [INTERACTIVE, BACKGROUND])
+
+    def test_429_waits_for_retry_after_and_pauses_the_key(self):
+        llm = CountingLLM(errors=[ProviderError(429, {"Retry-After": "0.3"})])
+        started = time.monotonic()
+        response = ScheduledLLM(llm, "retry-after-test", "test-key").invoke([HumanMessage(content="q")])
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual((response.content, llm.calls), ("answer 2", 2))
+        self.assertGreater(get_limiter("retry-after-test", "test-key").paused_until, started + 0.3)
+
+    def test_client_errors_are_not_retried(self):
+        llm = CountingLLM(errors=[ProviderError(400)])
+        with self.assertRaises(ProviderError):
+            ScheduledLLM(llm, "client-error-test", "test-key").invoke([HumanMessage(content="q")])
+        self.assertEqual(llm.calls, 1)
+
+    def test_overlapping_identical_calls_share_one_request(self):
+        llm = CountingLLM(delay=0.2)
+        scheduled = ScheduledLLM(llm, "single-flight-test", "test-key")
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(scheduled.invoke([HumanMessage(content="q")])))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(llm.calls, 1)
+        self.assertEqual([response.content for response in responses], ["answer 1"] * 3)
+        scheduled.invoke([HumanMessage(content="other")])
+        self.assertEqual(llm.calls, 2)
+
+
+class FlakyLLM:
+    """Fails each prompt with the given statuses, in order, before answering it."""
+
+    def __init__(self, failures):
+        self.failures = {prompt: list(statuses) for prompt, statuses in failures.items()}
+        self.calls = []
+
+    def invoke(self, messages):
+        prompt = messages[-1].content
+        self.calls.append(prompt)
+        if self.failures.get(prompt):
+            raise ProviderError(self.failures[prompt].pop(0))
+        return AIMessage(content=f"summary of {prompt}")
+
+
+@override_settings(LLM_SCHEDULER={"BACKOFF": 0, "MAX_RETRIES": 2})
+class SummarizerRetryTests(SimpleTestCase):
+    def summarize(self, llm, chunks):
+        return summarize_chunks(ScheduledLLM(llm, "test", "test-key"), chunks, lambda chunk: chunk, provider="test")
+
+    def test_transient_error_is_retried_by_the_scheduler_only(self):
+        llm = FlakyLLM({"a": [503]})
+        self.assertEqual(self.summarize(llm, ["a", "b"]), ["summary of a", "summary of b"])
+        self.assertEqual(llm.calls.count("a"), 2)
+
+    def test_attempts_are_capped_by_the_scheduler(self):
+        llm = FlakyLLM({"a": [503] * 10})
+        with self.assertRaises(ChunkSummaryError):
+            self.summarize(llm, ["a"])
+        self.assertEqual(llm.calls.count("a"), 3)
+
+    def test_client_error_is_not_retried(self):
+        llm = FlakyLLM({"a": [400]})
+        with self.assertRaises(ChunkSummaryError) as raised:
+            self.summarize(llm, ["a", "b"])
+        self.assertEqual(raised.exception.failed, [0])
+        self.assertEqual(llm.calls.count("a"), 1)
+
+
+class PackContextTests(SimpleTestCase):
+    LATENCY = "Latency is the delay before a transfer of data begins, measured in milliseconds."
+    PARKING = "Parking is free for visitors on weekends and after six in the evening."
+    REVENUE = "The annual report covers revenue, costs and the hiring plan for next year."
+
+    def test_near_duplicates_of_ranked_passages_are_dropped(self):
+        sources = [("file", "a.pdf", self.LATENCY + "\n\n" + self.PARKING),
+                   ("url", "https://example.com", self.LATENCY.lower().replace(",", ";"))]
+        context, report = pack_context("What is latency?", sources, 1000)
+        self.assertEqual(context.lower().count("latency is the delay"), 1)
+        self.assertEqual([(d["kind"], d["reason"]) for d in report["dropped"]], [("url", "duplicate")])
+
+    def test_best_passages_fill_the_budget_and_keep_source_order(self):
+        text = "\n\n".join([self.PARKING, self.REVENUE, self.LATENCY])
+        budget = count_tokens(self.LATENCY) + count_tokens(self.PARKING)
+        context, report = pack_context("latency and parking", [("file", "", text)], budget)
+        self.assertEqual(context, "File Context:\n" + self.PARKING + "\n\n" + self.LATENCY)
+        self.assertLessEqual(report["tokens"], budget)
+        self.assertEqual([d["reason"] for d in report["dropped"]], ["budget"])
+
+    def test_sources_are_labelled_once_per_run_of_passages(self):
+        text = f"[From URL: https://example.com]\n{self.LATENCY}\n\n{self.PARKING}"
+        sources = split_sources("url", text)
+        self.assertEqual(sources, [("url", "https://example.com", f"{self.LATENCY}\n\n{self.PARKING}")])
+        context, _ = pack_context("latency", sources, 1000)
+        self.assertEqual(context.count("[From URL: https://example.com]"), 1)
+
+
+class FakeSession(dict):
+    def __init__(self, session_key, **values):
+        super().__init__(values)
+        self.session_key = session_key
+
+
+class QuestionLLM:
+    """Answers each QA prompt with the question it asks; fails on questions in ``fail``."""
+
+    budget = {"context_tokens": 8192, "chunk_tokens": 1000}
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.prompts = []
+
+    def invoke(self, messages):
+        prompt = messages[-1].content
+        self.prompts.append(prompt)
+        question = prompt.rsplit("Q: ", 1)[1]
+        if question in self.fail:
+            raise RuntimeError(f"cannot answer {question}")
+        return AIMessage(content=f"Answer to {question}")
+
+
+class StubCorpus:
+    loads = 0
+
+    def __init__(self, request, document_ids=None):
+        StubCorpus.loads += 1
+        self.files = [("a.pdf", None)]
+        self.urls = []
+
+    def sources(self, question, budget):
+        return [("file", "a.pdf", "Latency is the delay before data moves. Parking is free on weekends.")]
+
+
+class AnswerBatchTests(TestCase):
+    def setUp(self):
+        self.request = SimpleNamespace(session=FakeSession("batch", model_name="mistral"))
+        self.llm = QuestionLLM(fail={"Why does it fail?"})
+        StubCorpus.loads = 0
+        patches = [mock.patch("agents.batch.get_llm", return_value=self.llm),
+                   mock.patch("agents.batch.BatchCorpus", StubCorpus)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def run_batch(self, questions):
+        lines = list(answer_batch(self.request, questions))
+        return sorted(lines[:-1], key=lambda line: line["index"]), lines[-1]
+
+    def test_each_question_gets_its_own_answer_over_one_corpus_load(self):
+        questions = ["What is latency?", "Is parking free?", "Why does it fail?"]
+        results, done = self.run_batch(questions)
+        self.assertEqual(StubCorpus.loads, 1)
+        self.assertEqual([r["question"] for r in results], questions)
+        self.assertEqual([r.get("answer") for r in results], ["Answer to What is latency?", "Answer to Is parking free?", None])
+        self.assertIn("cannot answer", results[2]["error"])
+        self.assertEqual(results[0]["sources"], ["a.pdf"])
+        self.assertEqual((done["questions"], done["answered"]), (3, 2))
+
+    def test_repeated_batch_is_answered_from_the_cache(self):
+        self.run_batch(["What is latency?"])
+        results, done = self.run_batch(["What is latency?"])
+        self.assertEqual(len(self.llm.prompts), 1)
+        self.assertEqual(results[0]["cache"], "exact")
+        self.assertEqual(done["answered"], 1)
+
+    def test_batch_answers_are_not_served_to_the_chat(self):
+        self.run_batch(["What is latency?"])
+        chat_key = answer_cache.context_key(self.request, question="What is latency?")
+        self.assertIsNone(answer_cache.lookup(chat_key, "What is latency?"))
+
+
+class AnswerCacheKeyTests(TestCase):
+    def key(self, question, memory="", session_key="chat"):
+        request = SimpleNamespace(session=FakeSession(session_key, model_name="mistral"))
+        return answer_cache.context_key(request, memory=memory, question=question)
+
+    def test_follow_ups_keep_the_conversation_in_the_key(self):
+        for question in ["Why?", "Give an example", "Continue", "Why is it slow?", "What about caching?"]:
+            self.assertNotEqual(self.key(question, "Q: What is latency?"), self.key(question, "Q: What is DNS?"), question)
+
+    def test_self_contained_questions_leave_the_conversation_out(self):
+        self.assertEqual(self.key("What is latency?", "Q: What is DNS?"), self.key("What is latency?"))
+
+    def test_keys_without_documents_are_not_shared_across_sessions(self):
+        self.assertNotEqual(self.key("What is latency?", session_key="one"), self.key("What is latency?", session_key="two"))
+        self.assertIsNone(self.key("What is latency?", session_key=None))
+
+    def test_fingerprint_reads_the_stored_summaries_digest(self):
+        document = save_document("", Document.FILE, "a.pdf", ["one", "two"], summaries=["One.", "Two."])
+        self.assertEqual(document.summaries_digest, summaries_digest([(0, 0, "One."), (0, 1, "Two.")]))
+        request = SimpleNamespace(session=FakeSession("chat", model_name="mistral"))
+        add_to_corpus(request, document, "a.pdf")
+
+        with self.assertNumQueries(1):
+            before = answer_cache.corpus_fingerprint(request)
+        Summary.objects.create(document=document, level=1, position=0, chunk_start=0, chunk_end=2, text="Both.")
+        update_summaries_digest(document)
+        self.assertNotEqual(answer_cache.corpus_fingerprint(request), before)
+
+        replace_chunks(document, ["one", "three"], "other-index")
+        self.assertEqual(Document.objects.get(pk=document.pk).summaries_digest, summaries_digest([(0, 0, "One.")]))
+
+class AgentGraphTests(TransactionTestCase):
+    """End to end through the views, with every provider pointed at the local stub server.
+
+    TransactionTestCase because graph branches read the database from worker threads.
+    """
+
+    def setUp(self):
+        self.server_context = stub_server(latency=0, tokens_per_second=0, completion_tokens=8)
+        self.server = self.server_context.__enter__()
+        self.media = tempfile.TemporaryDirectory()
+        endpoints = {
+            "llama3": f"{self.server.url}/openai/v1",
+            "gpt4": f"{self.server.url}/openai/v1",
+            "mistral": f"{self.server.url}/mistral/v1",
+        }
+        self.settings_context = override_settings(
+            MEDIA_ROOT=self.media.name, LLM_ENDPOINTS=endpoints,
+            LLM_CACHE={"ENABLED": False}, ANSWER_CACHE={"ENABLED": False},
+        )
+        self.settings_context.enable()
+        utils._llm_clients.clear()
+
+    def tearDown(self):
+        self.settings_context.disable()
+        self.server_context.__exit__(None, None, None)
+        self.media.cleanup()
+        utils._llm_clients.clear()
+
+    def test_graph_compiles(self):
+        self.assertIsNotNone(utils.build_graph())
+
+    def ask(self, model, question="What is latency?"):
+        if self.client.session.get("model_name") != model:
+            self.client.post(reverse("set_model"), {"model_name": model, "api_key": "test-key"})
+            self.assertEqual(self.client.session.get("model_name"), model)
+
+        response = self.client.post(reverse("index"), {"input_text": question})
+        errors = [str(m) for m in response.context["messages"] if m.level_tag == "error"]
+        self.assertEqual(errors, [])
+        self.assertTrue(response.context["result"]["final_answer"])
+        return response.context["result"]
+
+    def test_answers_question_with_mistral(self):
+        self.ask("mistral")
+        self.assertGreaterEqual(self.server.stats.snapshot()[0]["mistral"]["calls"], 2)
+
+    def test_answers_question_with_gpt4(self):
+        self.ask("gpt4")
+        self.assertGreaterEqual(self.server.stats.snapshot()[0]["openai"]["calls"], 2)
+
+    @override_settings(ANSWER_CACHE={"ENABLED": True})
+    def test_repeated_question_hits_answer_cache_later_in_the_chat(self):
+        self.assertNotIn("cache", self.ask("mistral"))
+        self.ask("mistral", "Which documents mention caching?")
+        # The conversation has grown, but the question does not refer back to it
+        self.assertEqual(self.ask("mistral")["cache"], "exact")
+        self.assertNotIn("cache", self.ask("mistral", "Why is it slow?"))
+
+
+
+class IngestionJobTests(TransactionTestCase):
+    """Jobs run synchronously here; TransactionTestCase because the workers close their DB connections."""
+
+    def setUp(self):
+        self.server_context = stub_server(latency=0, tokens_per_second=0, completion_tokens=8, pages=make_pages(1))
+        self.server = self.server_context.__enter__()
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_context = override_settings(
+            MEDIA_ROOT=self.media.name, LLM_ENDPOINTS={"mistral": f"{self.server.url}/mistral/v1"},
+            LLM_CACHE={"ENABLED": False}, ANSWER_CACHE={"ENABLED": False},
+        )
+        self.settings_context.enable()
+        utils._llm_clients.clear()
+
+    def tearDown(self):
+        self.settings_context.disable()
+        self.server_context.__exit__(None, None, None)
+        self.media.cleanup()
+        utils._llm_clients.clear()
+
+    def test_refresh_uses_session_key_and_finished_job_forgets_it(self):
+        self.client.post(reverse("set_model"), {"model_name": "mistral", "api_key": "test-key"})
+        stale = timezone.now() - timedelta(hours=2)
+        document = Document.objects.create(
+            session_key=self.client.session.session_key, kind=Document.URL,
+            name=f"{self.server.url}/pages/bench.html", fetched_at=stale,
+        )
+        # No session behind it, so no key to refresh it with
+        Document.objects.create(session_key="expired", kind=Document.URL, name=document.name, fetched_at=stale)
+
+        self.assertEqual(jobs.refresh_stale_urls(3600), 1)
+        job = IngestionJob.objects.get(document=document)
+        self.assertEqual(job.status, IngestionJob.DONE, job.error)
+        self.assertEqual(job.api_key, "")
+
+    def test_reset_cancels_running_job_and_discards_its_document(self):
+        self.client.post(reverse("set_model"), {"model_name": "mistral", "api_key": "test-key"})
+        session_key = self.client.session.session_key
+        job = IngestionJob.objects.create(
+            session_key=session_key, kind=Document.URL, name=f"{self.server.url}/pages/bench.html",
+            prompt="{chunk}", model_name="mistral", api_key="test-key",
+        )
+        session = self.client.session
+        session["ingestion_jobs"] = [job.id]
+        session.save()
+
+        def process(running):
+            running.document = Document.objects.create(session_key=session_key, kind=Document.URL, name=running.name)
+            self.client.get(reverse("reset_model"))  # the user resets while the job is summarizing
+
+        with mock.patch.object(jobs, "_process", side_effect=process):
+            jobs.run_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, IngestionJob.CANCELLED)
+        self.assertEqual(job.api_key, "")
+        self.assertFalse(Document.objects.filter(session_key=session_key).exists())
+        self.assertNotIn("ingestion_jobs", self.client.session)
+        self.assertNotIn("url_documents", self.client.session)
+
+
+class SharedFileTests(TestCase):
+    def setUp(self):
+        self.document = Document.objects.create(kind=Document.FILE, name="a.pdf", content_hash="abc", chunk_tokens=1000)
+        IngestionJob.objects.create(
+            kind=Document.FILE, name="a.pdf", prompt="{chunk}", model_name="mistral", rules=["Be brief."],
+            status=IngestionJob.DONE, document=self.document,
+        )
+
+    def test_shared_only_with_same_model_and_rules(self):
+        self.assertEqual(find_shared_file("abc", 1000, "mistral", ["Be brief."]), self.document)
+        self.assertIsNone(find_shared_file("abc", 1000, "gpt4", ["Be brief."]))
+        self.assertIsNone(find_shared_file("abc", 1000, "mistral", []))
+        self.assertIsNone(find_shared_file("abc", 1000, "mistral", ["Be brief.", "Answer in French."]))
+
+    def test_upload_is_kept_while_another_job_still_ingests_it(self):
+        with tempfile.TemporaryDirectory() as media:
+            path = os.path.join(media, "abc.pdf")
+            open(path, "wb").close()
+            job = IngestionJob.objects.create(kind=Document.FILE, name="b.pdf", path=path, prompt="{chunk}")
+            release_file(Document.objects.create(kind=Document.FILE, name="a.pdf", path=path))
+            self.assertTrue(os.path.exists(path))
+
+            IngestionJob.objects.filter(pk=job.pk).update(status=IngestionJob.DONE)
+            release_file(Document.objects.create(kind=Document.FILE, name="a.pdf", path=path))
+            self.assertFalse(os.path.exists(path))
+
+
+class DocumentIdTests(TestCase):
+    def test_stream_rejects_ids_that_are_not_numbers(self):
+        response = self.client.get(reverse("stream_answer"), {"q": "What is latency?", "documents": ["1", "x"]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_rejects_ids_that_are_not_numbers(self):
+        for documents in (["abc"], [1.5], "12", [True]):
+            response = self.client.post(
+                reverse("batch_questions"), {"questions": ["What is latency?"], "documents": documents},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 400, documents)
+
+
+class PdfWorkerTests(SimpleTestCase):
+    def test_mupdf_allocation_failure_is_a_memory_error(self):
+        with mock.patch("fitz.open", side_effect=RuntimeError("code=2: calloc (1 x 1073741824 bytes) failed")):
+            with self.assertRaises(MemoryError):
+                _pdf_pages("big.pdf", 0, 8)
+
+    def test_other_mupdf_errors_are_left_alone(self):
+        with mock.patch("fitz.open", side_effect=RuntimeError("code=7: no objects found")):
+            with self.assertRaisesRegex(RuntimeError, "no objects found"):
+                _pdf_pages("broken.pdf", 0, 8)
+
+    def make_pdf(self, directory, pages):
+        import fitz
+
+        path = os.path.join(directory, "pages.pdf")
+        with fitz.open() as pdf:
+            for i in range(pages):
+                pdf.new_page().insert_text((72, 72), f"Page {i}")
+            pdf.save(path)
+        return path
+
+    def test_pages_come_back_in_order_from_the_pool(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = {"WORKERS": 2, "PAGES_PER_TASK": 2, "TIMEOUT": 60, "MEMORY_LIMIT_MB": 0}
+            pages = list(iter_pdf_pages(self.make_pdf(directory, 5), config))
+        self.assertEqual([page.strip() for page in pages], [f"Page {i}" for i in range(5)])
+
+    def test_timed_out_workers_are_terminated(self):
+        started = []
+
+        def start_pool(config, tasks):
+            pool, workers, processes = start(config, tasks)
+            started.append(processes)
+            return pool, workers, processes
+
+        start = extraction._start_pool
+        with tempfile.TemporaryDirectory() as directory, mock.patch("agents.extraction._start_pool", start_pool):
+            config = {"WORKERS": 2, "PAGES_PER_TASK": 1, "TIMEOUT": 0, "MEMORY_LIMIT_MB": 0}
+            with self.assertRaisesRegex(ExtractionError, "timed out"):
+                list(iter_pdf_pages(self.make_pdf(directory, 3), config))
+        self.assertTrue(started[0])
+        for process in started[0]:
+            process.join(5)
+            self.assertFalse(process.is_alive())
+
+    def test_crash_cause_names_the_signal(self):
+        processes = [SimpleNamespace(exitcode=0), SimpleNamespace(exitcode=-9)]
+        self.assertIn("SIGKILL", extraction._crash_cause(processes))
+        self.assertEqual(extraction._crash_cause([SimpleNamespace(exitcode=3)]), "exited with code 3")
+
+class MainTextParserTests(SimpleTestCase):
+    PAGE = (
+        '<html><body><div id="content"><p>Article text.</p><nav><div>menu</div></nav>'
+        "<p>More article text.</p></div><footer>FOOTER JUNK</footer></body></html>"
+    )
+
+    def test_main_region_closes_after_skipped_nested_tags(self):
+        text = extract_main_text(self.PAGE)
+        self.assertIn("Article text.", text)
+        self.assertIn("More article text.", text)
+        self.assertNotIn("menu", text)
+        self.assertNotIn("FOOTER JUNK", text)
+
+    def test_done_once_main_region_closes(self):
+        parser = MainTextParser(max_chars=10_000)
+        parser.feed(self.PAGE)
+        self.assertTrue(parser.done)
+
+
+class BenchmarkWaitTests(TestCase):
+    def job(self, status, error=""):
+        return IngestionJob.objects.create(
+            kind=Document.URL, name="https://example.com", prompt="{chunk}", status=status, error=error,
+        )
+
+    def test_only_jobs_from_the_current_scenario_count(self):
+        self.job(IngestionJob.FAILED, "from an earlier scenario")
+        baseline = benchmark._last_job_id()
+        self.job(IngestionJob.DONE)
+        benchmark._wait_for_jobs(1, baseline)
+
+        self.job(IngestionJob.FAILED, "this scenario")
+        with self.assertRaisesRegex(RuntimeError, "this scenario"):
+            benchmark._wait_for_jobs(1, baseline)
@@ -0,0 +1,168 @@
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+DEFAULTS = {
+    "REQUEST_TIMINGS": False,  # attach a per-request span breakdown to the page / stream
+}
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, math.inf)
+PREFIX = "genie_"
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "TRACING", {})}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+# ---------------------- RECORDING ----------------------
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.setdefault(key, [0] * len(BUCKETS) + [0.0, 0])
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+
+class Span:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels  # may be filled in until the span ends, e.g. a response status
+        self.attrs = {}
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def span(name, **labels):
+    """Time a block into ``genie_<name>_seconds`` and the current request trace, if any."""
+    current = Span(name, labels)
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.attrs["error"] = f"{type(e).__name__}: {e}"
+        inc(f"{name}_errors_total", **current.labels)
+        raise
+    finally:
+        record(name, time.perf_counter() - started, current.labels, **current.attrs)
+
+
+def record(name, seconds, labels, **attrs):
+    """Record an already-measured span."""
+    observe(f"{name}_seconds", seconds, **labels)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append({"span": name, **labels, "seconds": round(seconds, 4), **attrs})
+
+
+@contextmanager
+def trace():
+    """Collect every span finished in this context (and threads started with its context) into a list."""
+    spans = []
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+
+def record_route(router, choice, **attrs):
+    """Count a routing decision and add it to the current trace; returns ``choice``."""
+    inc("route_decisions_total", router=router, choice=choice)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append({"span": "route", "router": router, "choice": choice, "seconds": 0, **attrs})
+    print(f"🔀 {router} → {choice}")
+    return choice
+
+
+def traced_node(name, fn):
+    def run(state):
+        with span("node", node=name):
+            return fn(state)
+    run.__name__ = fn.__name__
+    return run
+
+
+# ---------------------- EXPOSITION ----------------------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _gauges():
+    # Point-in-time values owned by other modules
+    from .llm_cache import get_cache
+    from .transport import host_metrics
+
+    gauges = {}
+    cache = get_cache()
+    if cache is not None:
+        for field, value in cache.stats().items():
+            gauges.setdefault(f"llm_cache_{field}", []).append(((), value))
+    for host, stats in host_metrics().items():
+        labels = (("host", host),)
+        gauges.setdefault("http_requests", []).append((labels, stats["requests"]))
+        gauges.setdefault("http_errors", []).append((labels, stats["errors"]))
+        gauges.setdefault("http_seconds", []).append((labels, stats["seconds"]))
+    return gauges
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(values) for key, values in _histograms.items()}
+
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {PREFIX}{name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, count in zip(BUCKETS, values):
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels, [('le', le)])} {count}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {values[-2]}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {values[-1]}")
+
+    for name, samples in sorted(_gauges().items()):
+        lines.append(f"# TYPE {PREFIX}{name} gauge")
+        for labels, value in samples:
+            lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,161 @@
+import importlib.util
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+DEFAULTS = {
+    "POOL_CONNECTIONS": 16,  # distinct hosts kept in the pool
+    "POOL_MAXSIZE": 32,  # keep-alive connections per host
+    "CONNECT_TIMEOUT": 5,
+    "READ_TIMEOUT": 60,
+    "HTTP2": True,
+}
+
+_lock = threading.Lock()
+_session = None
+_http_client = None
+_async_http_client = None
+_owner_pid = None
+_host_stats = {}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "HTTP_TRANSPORT", {})}
+
+
+def _record(host, seconds, status=None, error=False):
+    with _lock:
+        stats = _host_stats.setdefault(host, {"requests": 0, "errors": 0, "seconds": 0.0, "status": {}})
+        stats["requests"] += 1
+        stats["seconds"] += seconds
+        if error:
+            stats["errors"] += 1
+        if status is not None:
+            stats["status"][status] = stats["status"].get(status, 0) + 1
+
+
+# ---------------------- REQUESTS SESSION ----------------------
+class PooledSession(requests.Session):
+    def __init__(self, config):
+        super().__init__()
+        self.timeout = (config["CONNECT_TIMEOUT"], config["READ_TIMEOUT"])
+        adapter = HTTPAdapter(pool_connections=config["POOL_CONNECTIONS"], pool_maxsize=config["POOL_MAXSIZE"])
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlsplit(url).netloc
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except Exception:
+            _record(host, time.perf_counter() - started, error=True)
+            raise
+        _record(host, time.perf_counter() - started, response.status_code)
+        return response
+
+
+def _reset_after_fork():
+    # Sockets must not be shared between a pre-forking master and its workers
+    global _session, _http_client, _async_http_client, _owner_pid
+    if _owner_pid != os.getpid():
+        _session = None
+        _http_client = _async_http_client = None
+        _owner_pid = os.getpid()
+
+
+def get_session():
+    global _session
+    with _lock:
+        _reset_after_fork()
+        if _session is None:
+            _session = PooledSession(_config())
+        return _session
+
+
+# ---------------------- HTTPX CLIENT ----------------------
+def _on_request(request):
+    request.extensions["started"] = time.perf_counter()
+
+
+def _on_response(response):
+    # Time to response headers; the body may still be streaming
+    started = response.request.extensions.get("started", time.perf_counter())
+    _record(response.request.url.netloc.decode("ascii"), time.perf_counter() - started, response.status_code)
+
+
+async def _on_request_async(request):
+    _on_request(request)
+
+
+async def _on_response_async(response):
+    _on_response(response)
+
+
+def _httpx_options(config):
+    import httpx
+
+    return {
+        "http2": config["HTTP2"] and importlib.util.find_spec("h2") is not None,
+        "limits": httpx.Limits(
+            max_connections=config["POOL_CONNECTIONS"] * config["POOL_MAXSIZE"],
+            max_keepalive_connections=config["POOL_MAXSIZE"],
+        ),
+        "timeout": httpx.Timeout(config["READ_TIMEOUT"], connect=config["CONNECT_TIMEOUT"]),
+    }
+
+
+def get_http_client():
+    """Shared httpx client for the OpenAI-compatible providers; uses HTTP/2 when ``h2`` is installed."""
+    global _http_client
+    with _lock:
+        _reset_after_fork()
+        if _http_client is None:
+            import httpx
+
+            _http_client = httpx.Client(
+                **_httpx_options(_config()),
+                event_hooks={"request": [_on_request], "response": [_on_response]},
+            )
+        return _http_client
+
+
+def get_async_http_client():
+    """The async counterpart of ``get_http_client``, for the providers' async code paths."""
+    global _async_http_client
+    with _lock:
+        _reset_after_fork()
+        if _async_http_client is None:
+            import httpx
+
+            _async_http_client = httpx.AsyncClient(
+                **_httpx_options(_config()),
+                event_hooks={"request": [_on_request_async], "response": [_on_response_async]},
+            )
+        return _async_http_client
+
+
+# ---------------------- METRICS ----------------------
+def host_metrics():
+    with _lock:
+        metrics = {host: {**stats, "status": dict(stats["status"])} for host, stats in _host_stats.items()}
+        session = _session
+
+    if session is not None:
+        for adapter in set(session.adapters.values()):
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+                stats = metrics.setdefault(host, {"requests": 0, "errors": 0, "seconds": 0.0, "status": {}})
+                stats["connections_opened"] = stats.get("connections_opened", 0) + pool.num_connections
+                stats["idle_connections"] = stats.get("idle_connections", 0) + (pool.pool.qsize() if pool.pool else 0)
+    return metrics
@@ -12,5 +12,13 @@ urlpatterns = [
     path('delete-rule/<path:rule>/', views.delete_rule, name='delete_rule'),
     path("add-link/", views.add_link, name="add_link"),
     path("delete-link/<path:link>/", views.delete_link, name="delete_link"),
+    path("refresh-links/", views.refresh_links, name="refresh_links"),
+    path("stream/", views.stream_answer, name="stream_answer"),
+    path("batch/", views.batch_questions, name="batch_questions"),
+    path("history/", views.history_page, name="history_page"),
+    path("metrics/", views.metrics, name="metrics"),
+    path("metrics/http/", views.http_metrics, name="http_metrics"),
+    path("jobs/", views.job_list, name="job_list"),
+    path("jobs/<int:job_id>/", views.job_status, name="job_status"),
 
 ]
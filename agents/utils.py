@@ -1,99 +1,64 @@
+import json
+import operator
 import os
-import fitz  # PyMuPDF
-import docx
-import pptx
-import requests
-from typing import TypedDict
-
-from langgraph.graph import StateGraph
-from langchain_community.chat_models import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage
-from langchain_core.runnables import RunnableLambda
-
-from bs4 import BeautifulSoup
-
-def fetch_text_from_links(links):
-    texts = []
-    MAX_CHARS = 8000
-
-    for url in links:
-        try:
-            response = requests.get(url, timeout=10)
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            main_content = soup.find('div', {'id': 'bodyContent'})
-            clean_text = main_content.get_text(separator="\n") if main_content else soup.get_text()
-
-            if len(clean_text) > MAX_CHARS:
-                print(f"⚠️ Trimming content from {len(clean_text)} to {MAX_CHARS} characters.")
-                clean_text = clean_text[:MAX_CHARS]
-
-            print(f"📝 Raw text from {url}:\n{clean_text[:500]}...\n---")
-            texts.append(clean_text)
-        except Exception as e:
-            print(f"⚠️ Failed to fetch {url}: {e}")
-    return "\n".join(texts)
-
-
-def summarize_urls(request, links):
-    url_summaries = {}
-    combined_llm = get_llm(request)
-    for url in links:
-        try:
-            raw_text = fetch_text_from_links([url])
-            chunks = extract_text_chunks(raw_text)
-            summaries = []
-            for chunk in chunks:
-                resp = combined_llm.invoke([HumanMessage(content=f"Context:\n{chunk}\n\nSummarize this for knowledge extraction.")])
-                summaries.append(resp.content)
-            url_summaries[url] = summaries
-        except Exception as e:
-            print(f"❌ Failed to summarize {url}: {e}")
-    request.session["url_summaries"] = url_summaries
-    request.session.modified = True
+import threading
+import time
+from collections import OrderedDict
+from typing import Annotated, TypedDict
+
+from django.conf import settings
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from . import answer_cache
+from .chunking import DEFAULT_BUDGET, chunk_text, count_tokens, get_model_budget, get_overlap_tokens
+from .context_packer import pack_context, split_sources
+from .extraction import iter_text_from_file
+from .llm_cache import CachedLLM
+from .memory import get_memory
+from .models import Document
+from .retrieval import BM25Index, get_top_k, index_chunks, load_index
+from .store import get_chunks, get_summaries, get_target_files, get_url_documents
+from .scheduler import ScheduledLLM
+from .summarizer import summarize_chunks
+from .summary_tree import summary_context
+from .tracing import record_route, span, trace, traced_node
+from .transport import get_async_http_client, get_http_client, get_session
+from .webpage import fetch_page
+
+def fetch_url_if_modified(url, etag="", last_modified="", timeout=None):
+    """Conditional GET. Returns ``(None, headers)`` when the page is unchanged (304)."""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    with span("fetch", status="error") as current:
+        text, response = fetch_page(url, headers, {"TIMEOUT": timeout} if timeout else None)
+        current.labels["status"] = response.status_code
+        current.set(url=url)
+        return text, response.headers
 
 
 # ---------------------- TEXT EXTRACTION ----------------------
-def extract_text_from_file(file_path):
-    if file_path.endswith(".txt"):
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
+def iter_text_chunks(sections, budget=None):
+    """Chunk a stream of text sections to fit ``budget`` (an llm's ``.budget`` from get_llm)."""
+    budget = budget or DEFAULT_BUDGET
+    return chunk_text(sections, budget["chunk_tokens"], get_overlap_tokens())
 
-    elif file_path.endswith(".pdf"):
-        text = ""
-        with fitz.open(file_path) as pdf:
-            for page in pdf:
-                text += page.get_text()
-        return text
 
-    elif file_path.endswith(".docx"):
-        doc = docx.Document(file_path)
-        return "\n".join([para.text for para in doc.paragraphs])
-
-    elif file_path.endswith(".pptx"):
-        prs = pptx.Presentation(file_path)
-        text = ""
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + "\n"
-        return text
-
-    return "Unsupported file type."
-
-
-def extract_text_chunks(text, chunk_size=5000):
-    return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
+def extract_text_chunks(text, budget=None):
+    return list(iter_text_chunks([text], budget))
 
 
 # ---------------------- LLM WRAPPERS ----------------------
 class MistralWrapper:
-    def __init__(self, api_key, system_prompt=None):
+    def __init__(self, api_key, system_prompt=None, base_url=None):
         self.api_key = api_key
         self.system_prompt = system_prompt or ""
-        self.endpoint = "https://api.mistral.ai/v1/chat/completions"
+        self.endpoint = f"{base_url or get_endpoint('mistral')}/chat/completions"
 
-    def invoke(self, messages):
+    def _request(self, messages, **extra):
         content = "\n".join([msg.content for msg in messages if isinstance(msg, HumanMessage)])
         all_messages = []
         if self.system_prompt:
@@ -106,15 +71,45 @@ class MistralWrapper:
         }
         data = {
             "model": "mistral-large-latest",
-            "messages": all_messages
+            "messages": all_messages,
+            **extra,
         }
-        response = requests.post(self.endpoint, headers=headers, json=data)
+        return get_session().post(self.endpoint, headers=headers, json=data, stream=bool(extra.get("stream")))
+
+    def invoke(self, messages):
+        response = self._request(messages)
         response.raise_for_status()
         return type('LLMResponse', (object,), {"content": response.json()["choices"][0]["message"]["content"]})()
 
+    def stream(self, messages):
+        response = self._request(messages, stream=True)
+        response.raise_for_status()
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                delta = json.loads(payload)["choices"][0]["delta"].get("content")
+                if delta:
+                    yield type('LLMResponse', (object,), {"content": delta})()
+
 
 # ---------------------- LLM SETUP ----------------------
-def get_llm(request_or_dict):
+# Clients are stateless and thread-safe, so one per (model, api_key, rules) is shared by all requests
+MAX_LLM_CLIENTS = 64
+LLM_ENDPOINTS = {
+    "llama3": "https://api.groq.com/openai/v1",
+    "gpt4": "https://api.openai.com/v1",
+    "mistral": "https://api.mistral.ai/v1",
+}
+
+_llm_clients = OrderedDict()
+_llm_clients_lock = threading.Lock()
+
+
+def get_llm(request_or_dict, cache_scope=None):
     if isinstance(request_or_dict, dict):
         session = request_or_dict.get("session", {})
     else:
@@ -128,148 +123,370 @@ def get_llm(request_or_dict):
         raise ValueError("API key is required.")
 
     system_prompt = "\n".join(rules) if rules else None
+    key = (model, api_key, system_prompt, cache_scope)
+
+    with _llm_clients_lock:
+        llm = _llm_clients.get(key)
+        if llm is not None:
+            _llm_clients.move_to_end(key)
+            return llm
+
+    llm = _build_llm(model, api_key, system_prompt, cache_scope)
+
+    with _llm_clients_lock:
+        llm = _llm_clients.setdefault(key, llm)
+        while len(_llm_clients) > MAX_LLM_CLIENTS:
+            _llm_clients.popitem(last=False)
+    return llm
+
+
+def get_endpoint(model):
+    return {**LLM_ENDPOINTS, **getattr(settings, "LLM_ENDPOINTS", {})}[model]
+
+
+def _openai_clients(api_key, base_url=None):
+    # ChatOpenAI would build its sync and async clients from a single http_client,
+    # which cannot be both, so each gets its own pooled transport here
+    import openai
+
+    # max_retries=0: the scheduler retries, with the limiter's view of the provider
+    options = {"api_key": api_key, "base_url": base_url, "max_retries": 0}
+    return {
+        "client": openai.OpenAI(http_client=get_http_client(), **options).chat.completions,
+        "async_client": openai.AsyncOpenAI(http_client=get_async_http_client(), **options).chat.completions,
+    }
+
+
+def _build_llm(model, api_key, system_prompt, cache_scope):
+    # Provider SDKs are imported on first use so workers only load the ones they need
+    if model in ("llama3", "gpt4"):
+        from langchain_community.chat_models import ChatOpenAI
+        from langchain_core.runnables import RunnableLambda
 
     if model == "llama3":
         llm = ChatOpenAI(
             model_name="llama3-8b-8192",
             openai_api_key=api_key,
-            base_url="https://api.groq.com/openai/v1"
+            base_url=get_endpoint(model),
+            **_openai_clients(api_key, get_endpoint(model)),
         )
     elif model == "gpt4":
         llm = ChatOpenAI(
             model_name="gpt-4",
             openai_api_key=api_key,
+            base_url=get_endpoint(model),
+            **_openai_clients(api_key, get_endpoint(model)),
         )
     elif model == "mistral":
-        return MistralWrapper(api_key, system_prompt)
+        llm = ScheduledLLM(MistralWrapper(api_key, system_prompt), model, api_key, system_prompt)
+        return CachedLLM(llm, model, system_prompt, cache_scope, budget=get_model_budget(model))
     else:
         raise ValueError("Invalid model selected.")
 
-    def run_with_system(messages):
+    def with_system(messages):
         if system_prompt:
             messages = [SystemMessage(content=system_prompt)] + messages
-        return llm.invoke(messages)
+        return messages
 
-    return RunnableLambda(run_with_system)
+    # Piping into the chat model (rather than calling it inside the lambda) keeps .stream() token by token
+    llm = ScheduledLLM(RunnableLambda(with_system) | llm, model, api_key, system_prompt)
+    return CachedLLM(llm, model, system_prompt, cache_scope, budget=get_model_budget(model))
 
 
 # ---------------------- AGENT FUNCTIONS ----------------------
+def load_document_index(document):
+    index = load_index(document.index_key)
+    if index is None:
+        # The on-disk index was removed; rebuild it from the stored chunks
+        document.index_key = index_chunks(get_chunks(document))
+        document.save(update_fields=["index_key"])
+        index = load_index(document.index_key)
+    return index
+
+
 def retrieve_data(state):
     request = state["request"]
     llm = get_llm(request)
     query = state["input_text"]
     file_path = state.get("file_path")
 
-    file_text = request.session.get("file_text")
-    file_summaries = request.session.get("file_summaries")
-
-    # ✅ Use precomputed summaries if available
-    if file_summaries:
-        print("⚡ Using precomputed summaries from session")
-        return {"retrieved_data": "\n---\n".join(file_summaries)}
-
-    # 🔁 Fallback to processing chunks
-    if not file_text and file_path and os.path.exists(file_path):
-        print("📂 Re-reading file from disk")
-        file_text = extract_text_from_file(file_path)
-        request.session["file_text"] = file_text
-        request.session.modified = True
-
-    if file_text:
-        print("📄 Processing file content with chunking")
-        chunks = extract_text_chunks(file_text)
-        summaries = []
-
-        for i, chunk in enumerate(chunks):
-            print(f"🔍 Processing chunk {i+1}/{len(chunks)}")
-            resp = llm.invoke([
-                HumanMessage(content=f"Context:\n{chunk}\n\nBased on this context, answer or extract information related to: {query}")
-            ])
-            summaries.append(resp.content)
-
-        request.session["file_summaries"] = summaries
-        request.session.modified = True
-
-        return {"retrieved_data": "\n---\n".join(summaries)}
-
-    print("⚠️ No file content available. Using pure LLM.")
-    response = llm.invoke([HumanMessage(content=f"{query}")])
-    return {"retrieved_data": response.content}
+    documents = list(Document.objects.filter(pk__in=state.get("file_documents") or []))
+    sources = [(document, load_document_index(document)) for document in documents]
+
+    # 🔁 A new upload may still be ingesting in the background; index it directly from disk
+    if file_path and os.path.exists(file_path) and not any(d.path == file_path for d in documents):
+        print("📂 Reading file from disk")
+        sources.append((None, load_index(index_chunks(list(iter_text_chunks(iter_text_from_file(file_path), llm.budget))))))
+
+    sources = [(document, index) for document, index in sources if index is not None and index.chunks]
+    if not sources:
+        # qa_agent answers from general knowledge; no need for an extra LLM hop here
+        print("⚠️ No file content available.")
+        return {"retrieved_data": ""}
+
+    parts = []
+    file_hits = []
+    for i, hits in sorted(BM25Index.search_many([index for _, index in sources], query, get_top_k()).items()):
+        document, index = sources[i]
+        name = document.name if document is not None else os.path.basename(file_path)
+        print(f"📚 Retrieved chunks {[h + 1 for h in hits]} of {len(index.chunks)} from {name}")
+
+        # ✅ Use precomputed summaries of the matching chunks if available
+        summaries = get_summaries(document, hits) if document is not None else []
+        if summaries and len(summaries) == len(hits):
+            print("⚡ Using precomputed chunk summaries")
+            file_hits.append((document.pk, hits))
+        else:
+            summaries = summarize_chunks(
+                llm, [index.chunks[h] for h in hits],
+                lambda chunk: f"Context:\n{chunk}\n\nBased on this context, answer or extract information related to: {query}",
+                provider=request.session.get("model_name"),
+            )
+        text = "\n---\n".join(summaries)
+        parts.append(f"[From file: {name}]\n{text}" if len(sources) > 1 else text)
+
+    return {
+        "retrieved_data": "\n\n".join(parts),
+        # The summary tree can stand in for the summarizer only if every source has one
+        "file_hits": file_hits if len(file_hits) == len(parts) else [],
+    }
 
 
 def summarize_data(state):
     request = state["request"]
     llm = get_llm(request)
+
+    # 🌳 Pick the summary-tree level that fits instead of summarizing again
+    file_hits = state.get("file_hits") or []
+    if file_hits:
+        documents = Document.objects.in_bulk([document_id for document_id, _ in file_hits])
+        budget = llm.budget["chunk_tokens"] // 2 // len(file_hits)
+        parts = []
+        for document_id, hits in file_hits:
+            document = documents.get(document_id)
+            context = summary_context(document, hits, budget) if document is not None else ""
+            if not context:
+                break
+            parts.append(f"[From file: {document.name}]\n{context}" if len(file_hits) > 1 else context)
+        else:
+            return {"summarized_data": "\n\n".join(parts)}
+
     response = llm.invoke([HumanMessage(content=f"Summarize this: {state['retrieved_data']}")])
     return {"summarized_data": response.content}
 
 
+def answer_prompt(question, context, memory=""):
+    if not context:
+        prompt = f"Answer the following question using only your general knowledge:\n\nQ: {question}"
+    else:
+        prompt = f"Based on the following context, answer the question accurately:\n\n{context}\n\nQ: {question}"
+
+    # 🧠 Earlier turns, so follow-up questions can refer back to them
+    if memory:
+        prompt = f"Conversation so far:\n{memory}\n\n{prompt}"
+    return prompt
+
+
 def answer_question(state):
     request = state["request"]
     llm = get_llm(request)
 
-    context_parts = []
-
-    if "summarized_data" in state and state["summarized_data"]:
-        context_parts.append("File Context:\n" + state["summarized_data"])
+    # The summarizer is skipped when the retrieved data already fits
+    sources = split_sources("file", state.get("summarized_data") or state.get("retrieved_data") or "")
+    # URL branches finish in any order; keep the order the links were added in
+    for _, text in sorted(state.get("url_contexts") or []):
+        sources += split_sources("url", text)
 
-    if "url_context" in state and state["url_context"].strip():
-        context_parts.append("URL Context:\n" + state["url_context"].strip())
+    # 📦 Rank and pack passages into what is left of the model's budget after the question and memory
+    budget = llm.budget["chunk_tokens"] - count_tokens(state.get("memory") or "") - count_tokens(state["input_text"])
+    final_context, report = pack_context(state["input_text"], sources, max(budget, llm.budget["chunk_tokens"] // 4))
+    final_context = final_context.strip()
 
-    final_context = "\n\n".join(context_parts).strip()
+    prompt = answer_prompt(state["input_text"], final_context, state.get("memory"))
 
-    if not final_context:
-        prompt = f"Answer the following question using only your general knowledge:\n\nQ: {state['input_text']}"
-    else:
-        prompt = f"Based on the following context, answer the question accurately:\n\n{final_context}\n\nQ: {state['input_text']}"
+    on_token = state.get("on_token")
+    if on_token:
+        parts = []
+        for chunk in llm.stream([HumanMessage(content=prompt)]):
+            if chunk.content:
+                parts.append(chunk.content)
+                on_token(chunk.content)
+        return {"final_answer": "".join(parts), "context_report": report}
 
     response = llm.invoke([HumanMessage(content=prompt)])
 
-    return {"final_answer": response.content}
+    return {"final_answer": response.content, "context_report": report}
+
 
+def retrieve_url(state):
+    """One URL branch: top-k chunks of a linked page, summarized at the level that fits its budget share."""
+    document = Document.objects.filter(pk=state["document_id"]).first()
+    if document is None:
+        return {"url_contexts": []}
 
+    hits = load_document_index(document).search(state["input_text"], get_top_k())
+    # URL sources share the other half of the context budget
+    budget = get_llm(state["request"]).budget["chunk_tokens"] // 2 // state["url_count"]
+    context = summary_context(document, hits, budget) or "\n".join(get_summaries(document, hits))
+    return {"url_contexts": [(state["position"], f"[From URL: {state['url']}]\n{context}")]}
 
 
+def load_memory(state):
+    return {"memory": get_memory(state["request"])}
+
 
 # ---------------------- STATE GRAPH ----------------------
 class AgentState(TypedDict):
     input_text: str
     file_path: str
     request: any
+    has_file: bool
+    url_sources: list
+    url_contexts: Annotated[list, operator.add]  # (position, text) from each URL branch
+    memory: str
+    on_token: any
     retrieved_data: str
+    file_documents: list
+    file_hits: list  # (document id, chunk positions) with precomputed summaries
     summarized_data: str
+    context_report: dict  # passages packed into the answer prompt, and the ones dropped
     final_answer: str
 
 
-def process_file_with_graph(request, input_text, file_path=None):
-    # Prepare RAG from URLs
-    url_summaries = request.session.get("url_summaries", {})
-    url_context = ""
+_graph = None
+_graph_lock = threading.Lock()
+GRAPH_METRICS = {"warmup_seconds": None, "compiled_at": None}
 
-    if url_summaries:
-        for url, summaries in url_summaries.items():
-            url_context += f"\n[From URL: {url}]\n" + "\n".join(summaries) + "\n"
 
-    # Build the workflow
-    workflow = StateGraph(AgentState)
+def route_sources(state):
+    """Fan out to every context source at once: the file, each URL and the conversation memory."""
+    from langgraph.types import Send
+
+    sources = (["file"] if state["has_file"] else []) + (["urls"] if state["url_sources"] else [])
+    record_route("sources", "+".join(sources) or "none")
+
+    sends = [Send("conversation", state)]
+    if state["has_file"]:
+        sends.append(Send("retriever", state))
+    for position, (url, document_id) in enumerate(state["url_sources"]):
+        sends.append(Send("url_source", {
+            "input_text": state["input_text"],
+            "request": state["request"],
+            "url": url,
+            "document_id": document_id,
+            "position": position,
+            "url_count": len(state["url_sources"]),
+        }))
+    return sends
+
+
+def route_after_retrieval(state):
+    retrieved = state.get("retrieved_data") or ""
+    budget = get_llm(state["request"]).budget["chunk_tokens"] // 2
+    if not retrieved.strip():
+        return record_route("after_retrieval", "qa_agent", reason="no file context")
+    if count_tokens(retrieved) <= budget:
+        return record_route("after_retrieval", "qa_agent", reason="fits budget")
+    return record_route("after_retrieval", "summarizer", reason="over budget")
 
-    workflow.add_node("retriever", retrieve_data)
-    workflow.add_node("summarizer", summarize_data)
-    workflow.add_node("qa_agent", answer_question)
 
-    workflow.add_edge("retriever", "summarizer")
+def route_after_memory(state):
+    from langgraph.graph import END
+
+    # Without a file branch nothing else leads to qa_agent; URL branches finished in the same step
+    return END if state["has_file"] else "qa_agent"
+
+
+def build_graph():
+    from langgraph.graph import END, START, StateGraph
+
+    workflow = StateGraph(AgentState)
+
+    workflow.add_node("retriever", traced_node("retriever", retrieve_data))
+    workflow.add_node("url_source", traced_node("url_source", retrieve_url))
+    workflow.add_node("conversation", traced_node("conversation", load_memory))
+    workflow.add_node("summarizer", traced_node("summarizer", summarize_data))
+    workflow.add_node("qa_agent", traced_node("qa_agent", answer_question))
+
+    # All sources run in the first step; the next step only starts once the slowest
+    # of them is done, so the summarizer and qa_agent see every URL's context
+    workflow.add_conditional_edges(START, route_sources, ["retriever", "url_source", "conversation"])
+    workflow.add_conditional_edges("retriever", route_after_retrieval, ["summarizer", "qa_agent"])
+    workflow.add_conditional_edges("conversation", route_after_memory, ["qa_agent", END])
     workflow.add_edge("summarizer", "qa_agent")
-    workflow.set_entry_point("retriever")
 
-    executor = workflow.compile()
+    return workflow.compile()
+
+
+def get_graph():
+    # The compiled graph holds no per-request data, so one instance serves every thread
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                started = time.perf_counter()
+                _graph = build_graph()
+                GRAPH_METRICS["warmup_seconds"] = time.perf_counter() - started
+                GRAPH_METRICS["compiled_at"] = time.time()
+                print(f"🧩 Compiled agent graph in {GRAPH_METRICS['warmup_seconds'] * 1000:.1f} ms")
+    return _graph
 
-    # Inject context into the state
-    input_state = {
+
+def _input_state(request, input_text, file_path, document_ids=None):
+    # 🌐 Each linked URL becomes its own graph branch
+    url_sources = [(url, document.pk) for url, document in get_url_documents(request).items()]
+    file_documents = [document.pk for document in get_target_files(request, document_ids)]
+
+    return {
         "input_text": input_text,
         "file_path": file_path or "",
         "request": request,
-        "url_context": url_context.strip(),  # 🌐 added URL summaries here
+        "has_file": bool(file_path or file_documents),
+        "file_documents": file_documents,
+        "url_sources": url_sources,
+        "url_contexts": [],
     }
 
-    result = executor.invoke(input_state)
+
+def _cached_answer(request, input_text, file_path, document_ids):
+    """``(cache key, cached result or None)`` for this question against the current corpus."""
+    with span("answer_cache") as current:
+        key = answer_cache.context_key(request, file_path, get_memory(request), document_ids, input_text)
+        cached = answer_cache.lookup(key, input_text)
+        current.set(result=cached["cache"] if cached else "miss")
+    return key, cached
+
+
+def process_file_with_graph(request, input_text, file_path=None, document_ids=None):
+    """Answer ``input_text`` from the corpus documents in ``document_ids`` (all when empty)."""
+    with trace() as spans:
+        key, result = _cached_answer(request, input_text, file_path, document_ids)
+        if result is None:
+            result = get_graph().invoke(_input_state(request, input_text, file_path, document_ids))
+            answer_cache.store(key, input_text, result)
+    result["timings"] = spans
+    return result
+
+
+def stream_file_with_graph(request, input_text, file_path=None, emit=None, document_ids=None):
+    """Run the graph, calling ``emit(event, data)`` as each node finishes and for every answer token."""
+    with trace() as spans:
+        key, result = _cached_answer(request, input_text, file_path, document_ids)
+        if result is not None:
+            emit("node", {"node": "answer_cache"})
+            emit("token", {"text": result["final_answer"]})
+            result["timings"] = spans
+            return result
+
+        input_state = _input_state(request, input_text, file_path, document_ids)
+        input_state["on_token"] = lambda text: emit("token", {"text": text})
+        result = dict(input_state)
+        for mode, chunk in get_graph().stream(input_state, stream_mode=["updates", "values"]):
+            if mode == "values":
+                result = chunk  # full state, with the URL branches' contexts merged
+                continue
+            for node in chunk:
+                emit("node", {"node": node})
+        answer_cache.store(key, input_text, result)
+    result["timings"] = spans
     return result
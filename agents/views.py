@@ -1,134 +1,146 @@
-from django.shortcuts import render, redirect
+import asyncio
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.core.files.storage import default_storage
 from django.contrib import messages
 from .utils import (
     process_file_with_graph,
+    stream_file_with_graph,
     get_llm,
-    extract_text_from_file,
-    extract_text_chunks,
-    fetch_text_from_links  
 )
-from langchain.schema import HumanMessage
+from .batch import answer_batch, get_config as get_batch_config
+from .chunking import get_model_budget
+from .jobs import FILE_PROMPT, cancel_jobs, enqueue_job, enqueue_url_jobs, job_payload, refresh_urls, sync_jobs
+from .models import Document, IngestionJob
+from .tracing import get_config as get_tracing_config, render_metrics
+from .transport import host_metrics
+from .memory import get_config as get_conversation_config, update_memory
+from .store import (
+    add_to_corpus,
+    add_turn,
+    clear_session_data,
+    delete_documents,
+    find_shared_file,
+    get_corpus_files,
+    get_session_key,
+    get_turn_page,
+    remove_from_corpus,
+)
+from langchain_core.messages import HumanMessage
 import os
-import requests
-from bs4 import BeautifulSoup
 
 
 
 
 
 
+def _save_upload(uploaded_file):
+    """Store an upload under its content hash, so identical files are kept (and processed) once."""
+    digest = hashlib.sha256()
+    for block in uploaded_file.chunks():
+        digest.update(block)
+    content_hash = digest.hexdigest()
+    extension = os.path.splitext(uploaded_file.name)[1].lower()
+    relative_path = f"uploads/{content_hash[:2]}/{content_hash}{extension}"
+    if not default_storage.exists(relative_path):
+        uploaded_file.seek(0)
+        relative_path = default_storage.save(relative_path, uploaded_file)
+    return os.path.join(default_storage.location, relative_path), content_hash
+
+
+def _ingest_upload(request, uploaded_file):
+    """Add an upload to the corpus; returns its path if it still has to be processed, else ""."""
+    file_path, content_hash = _save_upload(uploaded_file)
+    model_name = request.session.get("model_name")
+    shared = find_shared_file(
+        content_hash, get_model_budget(model_name)["chunk_tokens"], model_name, request.session.get("rules", []),
+    )
+    if shared is not None:
+        add_to_corpus(request, shared, uploaded_file.name)
+        messages.success(request, f"♻️ '{uploaded_file.name}' was already processed; reusing it.")
+        return ""
+
+    enqueue_job(request, Document.FILE, uploaded_file.name, FILE_PROMPT, path=file_path)
+    return file_path
+
+
+def _document_ids(values):
+    """Corpus document ids as ints, or None when any value is not an id."""
+    if not isinstance(values, (list, tuple)):
+        return None
+    ids = []
+    for pk in values:
+        if isinstance(pk, str) and pk.strip().isdigit():
+            pk = int(pk)
+        if not isinstance(pk, int) or isinstance(pk, bool):
+            return None
+        ids.append(pk)
+    return ids
+
+
 def index(request):
     result = None
     input_text = ''
     file_path = ''
-    history = request.session.get("history", [])
     rules = request.session.get("rules", [])
     rag_links = request.session.get("rag_links", [])
-    upload_dir = os.path.join(default_storage.location, 'uploads')
-    uploaded_files = os.listdir(upload_dir) if os.path.exists(upload_dir) else []
+    document_ids = _document_ids(request.POST.getlist("documents"))
+    if document_ids is None:
+        messages.error(request, "❌ The selected documents are not valid document ids.")
 
-    if request.method == 'POST' and 'input_text' in request.POST:
+    if request.method == 'POST' and 'input_text' in request.POST and document_ids is not None:
         input_text = request.POST.get('input_text')
         uploaded_file = request.FILES.get('uploaded_file')
 
         if uploaded_file:
             try:
-                relative_path = default_storage.save(f"uploads/{uploaded_file.name}", uploaded_file)
-                file_path = os.path.join(default_storage.location, relative_path)
+                # Until its summaries are ready, retrieve_data reads a new file straight from file_path
+                file_path = _ingest_upload(request, uploaded_file)
                 messages.success(request, f"✅ File '{uploaded_file.name}' uploaded successfully.")
 
-                file_text = extract_text_from_file(file_path)
-                request.session["file_text"] = file_text
-                request.session["file_name"] = uploaded_file.name
-
-                chunks = extract_text_chunks(file_text)
-                summaries = []
-                llm = get_llm(request)
-                for i, chunk in enumerate(chunks):
-                    print(f"🔍 Preprocessing chunk {i+1}/{len(chunks)}")
-                    resp = llm.invoke([
-                        HumanMessage(content=f"Context:\n{chunk}\n\nSummarize this chunk.")
-                    ])
-                    summaries.append(resp.content)
-
-                request.session["file_summaries"] = summaries
-                request.session.modified = True
-
-                uploaded_files = os.listdir(upload_dir)
-
             except Exception as e:
                 messages.error(request, f"❌ File upload failed: {str(e)}")
 
-        if not file_path and request.session.get("file_name"):
-            file_path = os.path.join(upload_dir, request.session["file_name"])
-
-        # ✅ Summarize RAG URLs
-        if rag_links:
-            url_summaries = {}
-            llm = get_llm(request)
-            for url in rag_links:
-                try:
-                    print(f"🌐 Fetching and summarizing URL: {url}")
-                    raw_text = fetch_text_from_links([url])
-                    print(f"📝 Raw text from {url}:\n{raw_text[:1000]}")  # Print first 1000 chars
-                    chunks = extract_text_chunks(raw_text)
-                    summaries = []
-                    for i, chunk in enumerate(chunks):
-                        print(f"🔍 Summarizing URL chunk {i+1}/{len(chunks)}")
-                        response = llm.invoke([
-                            HumanMessage(content=f"Context:\n{chunk}\n\nSummarize this for knowledge extraction.")
-                        ])
-                        summaries.append(response.content)
-                    url_summaries[url] = summaries
-                except Exception as e:
-                    print(f"❌ Failed to summarize {url}: {e}")
-            request.session["url_summaries"] = url_summaries
-            request.session.modified = True
-
         # ✅ Process final answer
         if input_text:
             try:
-                result = process_file_with_graph(request, input_text, file_path)
+                result = process_file_with_graph(request, input_text, file_path, document_ids)
 
                 if file_path and os.path.exists(file_path):
-                    messages.success(request, f"🧠 File '{os.path.basename(file_path)}' was read and processed successfully.")
-
-                clean_result = result.copy()
-                if "request" in clean_result:
-                    del clean_result["request"]
+                    messages.success(request, f"🧠 File '{uploaded_file.name}' was read and processed successfully.")
 
-                history.append({
-                    "question": input_text,
-                    "result": clean_result
-                })
-                request.session["history"] = history
-                request.session.modified = True
+                add_turn(request, input_text, result)
+                update_memory(request, get_llm(request))
 
             except Exception as e:
                 messages.error(request, f"❌ Failed to process: {str(e)}")
 
+    jobs = sync_jobs(request)
+    # Only the latest page is rendered; older turns are fetched on demand from history_page
+    history, has_more_history = get_turn_page(request, size=get_conversation_config()["PAGE_SIZE"])
+
     return render(request, 'index.html', {
         'result': result,
+        'jobs': jobs,
         'history': history,
+        'has_more_history': has_more_history,
+        'timings': result.get("timings") if result and get_tracing_config()["REQUEST_TIMINGS"] else None,
         'question': input_text,
-        'uploaded_files': uploaded_files,
+        'corpus_files': get_corpus_files(request),
+        'selected_documents': document_ids or [],
         'rules': rules,
         'links': rag_links,
     })
 
 
 def delete_file(request, filename):
-    upload_dir = os.path.join(default_storage.location, 'uploads')
-    file_path = os.path.join(upload_dir, filename)
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    if remove_from_corpus(request, filename):
         messages.success(request, f"🗑️ File '{filename}' deleted.")
-
-        if request.session.get("file_name") == filename:
-            for key in ["file_name", "file_text", "file_summaries"]:
-                request.session.pop(key, None)
-            request.session.modified = True
     else:
         messages.error(request, "❌ File not found.")
     return redirect('index')
@@ -147,7 +159,7 @@ def set_model_settings(request):
                     "api_key": api_key,
                     "rules": rules
                 }
-            })
+            }, cache_scope=api_key)  # only skip the probe for a key that already worked
             llm.invoke([HumanMessage(content="Say hello!")])
 
             request.session['model_name'] = model
@@ -161,14 +173,13 @@ def set_model_settings(request):
 
 
 def reset_settings(request):
-    upload_dir = os.path.join(default_storage.location, 'uploads')
-    if os.path.exists(upload_dir):
-        for file in os.listdir(upload_dir):
-            file_path = os.path.join(upload_dir, file)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-
-    for key in ["file_text", "file_name", "file_summaries", "history", "model_name", "api_key", "rules", "rag_links"]:
+    # Uploads shared with other sessions are only removed once nothing links to them
+    if request.session.session_key:
+        # Jobs still ingesting would otherwise attach their documents after the reset
+        cancel_jobs(request.session.session_key)
+        clear_session_data(request.session.session_key)
+
+    for key in ["file_document_id", "url_documents", "model_name", "api_key", "rules", "rag_links", "ingestion_jobs"]:
         request.session.pop(key, None)
 
     request.session.modified = True
@@ -180,24 +191,8 @@ def upload_file_only(request):
     if request.method == 'POST' and request.FILES.get('uploaded_file'):
         uploaded_file = request.FILES['uploaded_file']
         try:
-            relative_path = default_storage.save(f"uploads/{uploaded_file.name}", uploaded_file)
-            file_path = os.path.join(default_storage.location, relative_path)
-            file_text = extract_text_from_file(file_path)
-
-            request.session["file_text"] = file_text
-            request.session["file_name"] = uploaded_file.name
-
-            chunks = extract_text_chunks(file_text)
-            summaries = []
-            llm = get_llm(request)
-            for i, chunk in enumerate(chunks):
-                print(f"🔍 Preprocessing chunk {i+1}/{len(chunks)}")
-                resp = llm.invoke([HumanMessage(content=f"Context:\n{chunk}\n\nSummarize this chunk.")])
-                summaries.append(resp.content)
-            request.session["file_summaries"] = summaries
-            request.session.modified = True
-
-            messages.success(request, f"✅ File '{uploaded_file.name}' uploaded and preprocessed for future use.")
+            if _ingest_upload(request, uploaded_file):
+                messages.success(request, f"✅ File '{uploaded_file.name}' uploaded and queued for preprocessing.")
         except Exception as e:
             messages.error(request, f"❌ Failed to upload file: {str(e)}")
 
@@ -230,21 +225,14 @@ def delete_rule(request, rule):
 
 
 
-def fetch_text_from_url(url):
-    try:
-        response = requests.get(url, timeout=10)
-        soup = BeautifulSoup(response.content, "html.parser")
-        # Remove script/style
-        for s in soup(["script", "style"]): s.extract()
-        return soup.get_text(separator=" ", strip=True)
-    except Exception as e:
-        return ""
-
 def add_link(request):
     if request.method == 'POST':
-        new_link = request.POST.get("url")
+        # One or more URLs, separated by whitespace; several are fetched concurrently
+        new_links = [
+            link for link in dict.fromkeys(request.POST.get("url", "").split())
+            if link.startswith(("http://", "https://"))
+        ]
         rag_links = request.session.get("rag_links", [])
-        url_summaries = request.session.get("url_summaries", {})
 
         model = request.session.get("model_name")
         api_key = request.session.get("api_key")
@@ -252,42 +240,17 @@ def add_link(request):
             messages.error(request, "❌ Please set a model and API key before adding URLs.")
             return redirect("index")
 
-        if not new_link:
+        if not new_links:
             messages.error(request, "❌ No URL provided.")
             return redirect("index")
 
-        if new_link in rag_links:
+        added = [link for link in new_links if link not in rag_links]
+        if not added:
             messages.warning(request, "⚠️ This URL is already added.")
             return redirect("index")
 
-        try:
-            print(f"🌐 Fetching: {new_link}")
-            raw_text = fetch_text_from_url(new_link)
-            print(f"📝 Raw fetched text from {new_link}:\n{'-'*40}\n{raw_text[:1000]}\n{'-'*40}")
-
-            if raw_text.strip():
-                chunks = extract_text_chunks(raw_text)
-                summaries = []
-                llm = get_llm(request)
-
-                for i, chunk in enumerate(chunks):
-                    print(f"🔍 Summarizing URL chunk {i+1}/{len(chunks)}")
-                    resp = llm.invoke([HumanMessage(content=f"Summarize this chunk:\n\n{chunk}")])
-                    summaries.append(resp.content)
-
-                rag_links.append(new_link)
-                url_summaries[new_link] = summaries
-                request.session["rag_links"] = rag_links
-                request.session["url_summaries"] = url_summaries
-                request.session.modified = True
-
-                messages.success(request, f"✅ Link added and processed: {new_link}")
-            else:
-                messages.warning(request, f"⚠️ The link was fetched, but no usable text was found.")
-
-        except Exception as e:
-            print(f"❌ Error processing link {new_link}: {e}")
-            messages.error(request, f"❌ Failed to process the link: {e}")
+        enqueue_url_jobs(request, added)
+        messages.info(request, f"⏳ Link(s) queued for processing: {', '.join(added)}")
 
     return redirect("index")
 
@@ -298,6 +261,149 @@ def delete_link(request, link):
     if link in rag_links:
         rag_links.remove(link)
         request.session["rag_links"] = rag_links
+        request.session.get("url_documents", {}).pop(link, None)
+        delete_documents(get_session_key(request), Document.URL, link)
         request.session.modified = True
         messages.success(request, f"🗑️ Link removed: {link}")
     return redirect("index")
+
+
+def refresh_links(request):
+    if request.method == 'POST':
+        count = refresh_urls(request)
+        if count:
+            messages.info(request, f"🔄 Checking {count} URL(s) for changes.")
+        else:
+            messages.warning(request, "⚠️ No URLs to refresh.")
+    return redirect("index")
+
+
+def job_list(request):
+    jobs = sync_jobs(request)
+    return JsonResponse({"jobs": [job_payload(job) for job in jobs]})
+
+
+def job_status(request, job_id):
+    job = get_object_or_404(IngestionJob, pk=job_id, session_key=request.session.session_key)
+    return JsonResponse(job_payload(job))
+
+
+def history_page(request):
+    before = request.GET.get("before")
+    turns, has_more = get_turn_page(
+        request,
+        before=int(before) if before and before.isdigit() else None,
+        size=get_conversation_config()["PAGE_SIZE"],
+    )
+    return JsonResponse({
+        "turns": [{"id": turn.pk, "question": turn.question, "final_answer": turn.final_answer} for turn in turns],
+        "has_more": has_more,
+    })
+
+
+def metrics(request):
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def http_metrics(request):
+    return JsonResponse({"hosts": host_metrics()})
+
+
+def _stream_setup(request):
+    # Anything that touches the session cookie must happen before the response starts streaming
+    get_session_key(request)
+    get_corpus_files(request)
+
+
+async def stream_answer(request):
+    input_text = request.GET.get("q", "").strip()
+    if not input_text:
+        return JsonResponse({"error": "No question provided."}, status=400)
+    document_ids = _document_ids(request.GET.getlist("documents"))
+    if document_ids is None:
+        return JsonResponse({"error": "documents must be document ids."}, status=400)
+
+    await sync_to_async(_stream_setup)(request)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def emit(event, data):
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    def run():
+        try:
+            result = stream_file_with_graph(request, input_text, None, emit, document_ids)
+            add_turn(request, input_text, result)
+            done = {"final_answer": result.get("final_answer", ""), "context": result.get("context_report")}
+            if get_tracing_config()["REQUEST_TIMINGS"]:
+                done["timings"] = result.get("timings", [])
+            emit("done", done)
+            update_memory(request, get_llm(request))
+        except Exception as e:
+            print(f"❌ Streaming answer failed: {e}")
+            emit("error", {"message": str(e)})
+        finally:
+            connection.close()
+            emit(None, None)
+
+    loop.run_in_executor(None, run)
+
+    async def events():
+        while True:
+            event, data = await queue.get()
+            if event is None:
+                break
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def batch_questions(request):
+    """POST {"questions": [...], "documents": [ids]}; answers stream back as JSON lines as they finish."""
+    if request.method != "POST":
+        return JsonResponse({"error": "POST a JSON body with a list of questions."}, status=405)
+    try:
+        payload = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "The body must be JSON."}, status=400)
+
+    questions = [q.strip() for q in payload.get("questions") or [] if isinstance(q, str) and q.strip()]
+    if not questions:
+        return JsonResponse({"error": "No questions provided."}, status=400)
+    limit = get_batch_config()["MAX_QUESTIONS"]
+    if len(questions) > limit:
+        return JsonResponse({"error": f"At most {limit} questions per batch."}, status=400)
+    document_ids = _document_ids(payload.get("documents") or [])
+    if document_ids is None:
+        return JsonResponse({"error": "documents must be a list of document ids."}, status=400)
+
+    await sync_to_async(_stream_setup)(request)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def run():
+        try:
+            for line in answer_batch(request, questions, document_ids):
+                loop.call_soon_threadsafe(queue.put_nowait, line)
+        except Exception as e:
+            print(f"❌ Batch failed: {e}")
+            loop.call_soon_threadsafe(queue.put_nowait, {"error": str(e)})
+        finally:
+            connection.close()
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    loop.run_in_executor(None, run)
+
+    async def lines():
+        while True:
+            line = await queue.get()
+            if line is None:
+                break
+            yield json.dumps(line) + "\n"
+
+    response = StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,190 @@
+import codecs
+import re
+import time
+from html.parser import HTMLParser
+
+from django.conf import settings
+
+from .tracing import inc, record
+from .transport import get_session
+
+
+DEFAULTS = {
+    "MAX_BYTES": 2 * 1024 * 1024,  # body bytes read before the download is cut off
+    "MAX_CHARS": 100_000,  # main-content characters kept; parsing stops once this many are collected
+    "READ_BYTES": 64 * 1024,
+    "TIMEOUT": 10,
+}
+
+SKIP_TAGS = frozenset("script style nav noscript template svg iframe title select button".split())
+BLOCK_TAGS = frozenset(
+    "p div br li ul ol tr td th table section article main header h1 h2 h3 h4 h5 h6 pre blockquote dd dt hr".split()
+)
+MAIN_IDS = frozenset("bodyContent content main main-content mw-content-text".split())
+CHARSET_RE = re.compile(r"charset=[\"']?([\w.:-]+)", re.I)
+SPACE_RE = re.compile(r"\s+")
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "WEB_FETCH", {})}
+
+
+# ---------------------- PARSER ----------------------
+class MainTextParser(HTMLParser):
+    """Incremental HTML-to-text for ``feed()``-ing a download as it arrives.
+
+    Text inside script, style, nav and other chrome is dropped. Text inside the
+    main region (<main>, role="main", or a known content id such as Wikipedia's
+    bodyContent) is preferred over the whole page; ``done`` turns true once
+    that region has closed or ``max_chars`` of text have been collected.
+    """
+
+    def __init__(self, max_chars):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.main_parts, self.page_parts = [], []
+        self.main_chars = self.page_chars = 0
+        self._skip = []  # open skipped tags; their text is ignored
+        self._main = None  # [tag, depth] of the main region being read
+        self._main_closed = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip.append(tag)
+            return
+        if self._skip:
+            # handle_endtag ignores everything inside a skipped block, so its start tags must not count either
+            return
+        if self._main is not None:
+            if tag == self._main[0]:
+                self._main[1] += 1
+        elif not self._main_closed:
+            attrs = dict(attrs)
+            if tag == "main" or attrs.get("role") == "main" or attrs.get("id") in MAIN_IDS:
+                self._main = [tag, 1]
+        if tag in BLOCK_TAGS:
+            self._newline()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._newline()
+
+    def handle_endtag(self, tag):
+        if self._skip:
+            if tag in self._skip:
+                # Unclosed tags inside a skipped block are closed with it
+                del self._skip[len(self._skip) - 1 - self._skip[::-1].index(tag):]
+            return
+        if self._main is not None and tag == self._main[0]:
+            self._main[1] -= 1
+            if not self._main[1]:
+                self._main = None
+                self._main_closed = bool(self.main_chars)
+        if tag in BLOCK_TAGS:
+            self._newline()
+
+    def handle_data(self, data):
+        if self._skip or self.done:
+            return
+        text = SPACE_RE.sub(" ", data)
+        if not text.strip():
+            return
+        if self._main is not None:
+            self.main_parts.append(text)
+            self.main_chars += len(text)
+        elif self.page_chars < self.max_chars:
+            self.page_parts.append(text)
+            self.page_chars += len(text)
+
+    def _newline(self):
+        parts = self.main_parts if self._main is not None else self.page_parts
+        if parts and parts[-1] != "\n":
+            parts.append("\n")
+
+    @property
+    def done(self):
+        if self._main_closed or self.main_chars >= self.max_chars:
+            return True
+        # No main region yet and a full budget of page text: good enough
+        return self._main is None and self.page_chars >= self.max_chars
+
+    def text(self):
+        parts = self.main_parts if self.main_chars else self.page_parts
+        lines = (" ".join(line.split()) for line in "".join(parts).splitlines())
+        return "\n".join(line for line in lines if line)[:self.max_chars]
+
+
+def extract_main_text(html, max_chars=None):
+    """Main text of an already-downloaded page (``str`` or ``bytes``)."""
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    parser = MainTextParser(max_chars or _config()["MAX_CHARS"])
+    parser.feed(html)
+    parser.close()
+    return parser.text()
+
+
+# ---------------------- FETCH ----------------------
+def _encoding(response):
+    match = CHARSET_RE.search(response.headers.get("Content-Type", ""))
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+def fetch_page(url, headers=None, config=None):
+    """GET ``url`` and return ``(text, response)``, reading at most MAX_BYTES of the body.
+
+    The body is decoded and parsed as it streams in, and the download stops as
+    soon as the parser has enough main content. ``text`` is None for a 304.
+    """
+    config = {**_config(), **(config or {})}
+    response = get_session().get(url, headers=headers or {}, timeout=config["TIMEOUT"], stream=True)
+    try:
+        if response.status_code == 304:
+            return None, response
+        response.raise_for_status()
+
+        decoder = codecs.getincrementaldecoder(_encoding(response))(errors="replace")
+        is_html = "html" in response.headers.get("Content-Type", "text/html")
+        parser = MainTextParser(config["MAX_CHARS"])
+        plain = []
+        read = 0
+        busy = 0.0  # decode and parse time, not time spent waiting on the network
+        stop = "eof"
+        for block in response.iter_content(config["READ_BYTES"]):
+            started = time.perf_counter()
+            block = block[:config["MAX_BYTES"] - read]
+            read += len(block)
+            chunk = decoder.decode(block)
+            if is_html:
+                parser.feed(chunk)
+            else:
+                plain.append(chunk)
+            busy += time.perf_counter() - started
+            if is_html and parser.done:
+                stop = "enough_text"
+                break
+            if read >= config["MAX_BYTES"]:
+                stop = "byte_cap"
+                print(f"⚠️ Stopped reading {url} at {read} bytes.")
+                break
+
+        started = time.perf_counter()
+        if is_html:
+            parser.feed(decoder.decode(b"", final=True))
+            parser.close()
+            text = parser.text()
+        else:
+            text = "".join(plain + [decoder.decode(b"", final=True)])[:config["MAX_CHARS"]]
+        busy += time.perf_counter() - started
+
+        inc("fetch_stops_total", reason=stop)
+        record("html_parse", busy, {"stop": stop}, url=url, bytes=read, chars=len(text))
+        return text, response
+    finally:
+        # Unread bytes are discarded with the connection rather than downloaded
+        response.close()
@@ -127,3 +127,128 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+
+# Max in-flight LLM calls per provider when summarizing chunks; failed calls are retried by LLM_SCHEDULER
+LLM_CONCURRENCY = {
+    'llama3': 4,
+    'gpt4': 8,
+    'mistral': 2,
+}
+
+# Persistent LLM response cache (SQLite, LRU + TTL eviction)
+LLM_CACHE = {
+    'ENABLED': True,
+    'PATH': BASE_DIR / 'llm_cache.sqlite3',
+    'TTL': 7 * 24 * 3600,
+    'MAX_ENTRIES': 20000,
+    'MAX_BYTES': 200 * 1024 * 1024,
+}
+
+# Number of BM25-ranked chunks sent to the LLM per source and question
+RETRIEVAL_TOP_K = 4
+
+# Background ingestion (in-process thread pool, job state persisted in the DB).
+# Running jobs send a heartbeat; one silent for STALE_SECONDS is requeued, so keep it well above the heartbeat
+INGESTION_WORKERS = 2
+INGESTION_HEARTBEAT_SECONDS = 30
+INGESTION_STALE_SECONDS = 900
+
+# Shared keep-alive HTTP transport for LLM providers and URL fetching
+HTTP_TRANSPORT = {
+    'POOL_CONNECTIONS': 16,
+    'POOL_MAXSIZE': 32,
+    'CONNECT_TIMEOUT': 5,
+    'READ_TIMEOUT': 60,
+    'HTTP2': True,  # used by the OpenAI-compatible clients when the h2 package is installed
+}
+
+# URL ingestion: bodies are streamed and parsed as they arrive, and reading stops at
+# MAX_BYTES or once MAX_CHARS of main-content text have been collected
+WEB_FETCH = {
+    'MAX_BYTES': 2 * 1024 * 1024,
+    'MAX_CHARS': 100_000,
+    'READ_BYTES': 64 * 1024,
+    'TIMEOUT': 10,
+}
+
+# Several URLs added or refreshed together are fetched concurrently within one deadline
+URL_FETCH = {
+    'MAX_WORKERS': 16,
+    'PER_HOST': 4,
+    'DEADLINE': 30,  # seconds; pages still loading are reported as timed out
+}
+
+# Document extraction: PDF pages are parsed in a spawned process pool
+EXTRACTION = {
+    'WORKERS': None,  # defaults to the number of cores
+    'PAGES_PER_TASK': 8,
+    'TIMEOUT': 300,  # seconds per document
+    'MEMORY_LIMIT_MB': 1024,  # per worker process
+    'MAX_CHARS': 20_000_000,
+}
+
+# Per-model token budgets; chunks are packed up to chunk_tokens, leaving room for the prompt and reply
+LLM_MODELS = {
+    'llama3': {'context_tokens': 8192, 'chunk_tokens': 6000},
+    'gpt4': {'context_tokens': 8192, 'chunk_tokens': 6000},
+    'mistral': {'context_tokens': 128000, 'chunk_tokens': 16000},
+}
+CHUNK_OVERLAP_TOKENS = 200
+
+# Conversation history: older turns are folded into a rolling summary used as chat memory
+CONVERSATION = {
+    'MAX_TURNS': 200,  # stored turns per session; older ones survive only in the summary
+    'RECENT_TURNS': 4,  # turns passed verbatim; older ones are folded in batches of this size
+    'PAGE_SIZE': 10,  # turns rendered per page
+    'SUMMARY_WORDS': 250,
+}
+
+# Every LLM call waits for its provider's per-minute budget (per API key; tune to your account tier).
+# Questions go ahead of background ingestion; 429s and 5xx are retried with jittered backoff,
+# honoring Retry-After, and identical prompts in flight at the same time share one request.
+LLM_SCHEDULER = {
+    'LIMITS': {
+        'llama3': {'rpm': 30, 'tpm': 30000},
+        'gpt4': {'rpm': 500, 'tpm': 30000},
+        'mistral': {'rpm': 300, 'tpm': 2000000},
+    },
+    'COMPLETION_TOKENS': 512,  # reserved per call until the reply's size is known
+    'MAX_RETRIES': 5,
+    'BACKOFF': 1.0,
+    'MAX_BACKOFF': 60,
+}
+
+# The answer prompt's context is packed from ranked file and URL passages into the model's
+# chunk_tokens, less the question and conversation memory; near-duplicate passages are dropped
+CONTEXT_PACKING = {
+    'MAX_PASSAGE_TOKENS': 800,
+    'DUPLICATE_SIMILARITY': 0.8,
+}
+
+# Batch question API (POST /batch/ and manage.py batch_questions): the corpus is loaded once per
+# batch and QA calls run concurrently, at background priority
+BATCH_QUESTIONS = {
+    'MAX_QUESTIONS': 500,
+    'WORKERS': None,  # defaults to the model's LLM_CONCURRENCY
+}
+
+# Provider base URLs, e.g. {'gpt4': 'http://127.0.0.1:8001/v1'}; the benchmark command points these at its stub server
+LLM_ENDPOINTS = {}
+
+# Span metrics are always collected and served at /metrics/; REQUEST_TIMINGS also shows them per answer
+TRACING = {
+    'REQUEST_TIMINGS': DEBUG,
+}
+
+# Compile the agent graph at worker startup instead of on the first question.
+# Enable with gunicorn --preload so forked workers share the imported modules.
+WARM_AGENT_GRAPH = False
+
+# Whole-answer cache in front of the agent graph, keyed on the question and a fingerprint
+# of the active documents, model, rules and conversation memory
+ANSWER_CACHE = {
+    'ENABLED': True,
+    'TTL': 24 * 3600,
+    'SIMILARITY': 0.8,  # near-duplicates must share key terms and be this similar as text
+    'MAX_ENTRIES': 5000,
+}
@@ -14,3 +14,16 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'genie_project.settings')
 
 application = get_wsgi_application()
+
+# Pick up ingestion jobs left unfinished by a previous worker. Compiling the agent
+# graph up front (and importing langgraph with it) is opt-in: it makes the first
+# question faster but every worker pays for it at boot.
+from django.conf import settings  # noqa: E402
+
+from agents.jobs import resume_jobs  # noqa: E402
+
+if getattr(settings, "WARM_AGENT_GRAPH", False):
+    from agents.utils import get_graph
+
+    get_graph()
+resume_jobs()